@@ -0,0 +1,711 @@
+import concurrent.futures
+import datetime
+import json
+import math
+import os
+from functools import lru_cache
+
+import instrumentation
+from backends import make_backend
+from food_store import FoodStore
+from image_prep import PayloadCache, cached_image, encode_thumbnail, prepare_image
+from instrumentation import stage
+from meal_log import MealLog
+from model_client import CircuitBreaker, CircuitOpenError, ResilientBackend, TokenBucket, is_transient
+from name_index import TrigramIndex
+from nutrition_parser import NUTRITION_SCHEMA, ParseError, parse_many, parse_nutrition
+from phash_index import PerceptualIndex, phash
+from prefetch import TaskPool
+from response_cache import ResponseCache, make_key
+from session_store import SessionStore
+from singleflight import SingleFlight
+
+# ------------------- ANALYSIS CORE ------------------- #
+# Image prep, prompting, parsing, follow-ups and the report, with no UI. Importing
+# this module has no side effects: the model backend, caches and indexes are
+# created on first use and shared by every caller in the process (Streamlit
+# sessions, the CLI and the HTTP endpoint). pandas is only imported by the
+# functions that return DataFrames.
+
+# ------------------- CONFIG ------------------- #
+# "gemini[:<endpoint URL>]", "fake[:latency[:error_rate]]", "cassette:<path>" or "record:<path>"
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "gemini")
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")  # required by the gemini and record backends
+GEMINI_MODEL_NAME = "gemini-2.5-pro-exp-03-25"
+MODEL_RATE_PER_SECOND = float(os.environ.get("MODEL_RATE_PER_SECOND", 2.0))  # shared by all sessions in this process
+MODEL_BURST = 5
+MODEL_TIMEOUT = 60  # seconds per call
+MODEL_RETRIES = 3
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3")
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # 1 week
+IMAGE_MAX_EDGE = 1024  # px, longest side sent to the model
+IMAGE_MAX_BYTES = 300 * 1024
+IMAGE_FORMAT = "JPEG"  # or "WEBP"
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+THUMBNAIL_EDGE = 384  # px, what a session keeps of each upload for display
+SESSION_STORE_MAX_BYTES = int(os.environ.get("SESSION_STORE_MAX_BYTES", 64 * 1024 * 1024))  # all sessions
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 1024 * 1024))  # one session
+PHASH_INDEX_PATH = os.environ.get("PHASH_INDEX_PATH", ".cache/phash_index.sqlite3")
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", 6))  # bits out of 64
+FOLLOWUP_WORKERS = 8
+# "separate": one prompt per follow-up section; "combined": one JSON call for all of them,
+# with per-section prompts only for sections missing from its answer
+FOLLOWUP_MODE = os.environ.get("FOLLOWUP_MODE", "separate")
+PREFETCH_FOLLOWUPS = os.environ.get("PREFETCH_FOLLOWUPS", "1") not in ("", "0")
+PREFETCH_MAX_PENDING = 32  # speculative follow-ups are dropped beyond this many in flight
+ALTERNATIVES_COUNT = 3
+FAST_PATH_MIN_SCORE = 0.75  # trigram similarity needed to skip the vision model
+BATCH_CONCURRENCY = 4  # default max in-flight vision calls per batch
+REFERENCE_GRAMS = 100  # the model is asked for nutrition per this many grams
+REFERENCE_PORTION = f"{REFERENCE_GRAMS} g reference"
+NUTRITION_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": NUTRITION_SCHEMA}
+NUTRITION_PARSE_RETRIES = 2
+DAILY_CALORIES = 2000
+DAILY_MACROS = {"protein": 50, "carbs": 275, "fats": 70}
+
+FOOD_STORE_PATH = os.environ.get("FOOD_STORE_PATH", "data/foods.csv")
+MEAL_LOG_PATH = os.environ.get("MEAL_LOG_PATH", "data/meal_log.sqlite3")
+
+# Built-in fallback when no food table file is available (Western and Indian)
+FOOD_DATABASE = {
+    "Chicken Biryani": {"calories": 350, "protein": 15, "carbs": 45, "fats": 12},
+    "Paneer Tikka": {"calories": 280, "protein": 18, "carbs": 10, "fats": 20},
+    "Dal Tadka": {"calories": 200, "protein": 10, "carbs": 30, "fats": 5},
+    "Masala Dosa": {"calories": 320, "protein": 6, "carbs": 50, "fats": 10},
+    "Cheeseburger": {"calories": 550, "protein": 25, "carbs": 40, "fats": 30},
+    "Caesar Salad": {"calories": 350, "protein": 12, "carbs": 20, "fats": 25},
+    "Margherita Pizza": {"calories": 850, "protein": 35, "carbs": 100, "fats": 30},
+    "Grilled Salmon": {"calories": 400, "protein": 35, "carbs": 0, "fats": 28},
+    "Vegetable Stir Fry": {"calories": 250, "protein": 8, "carbs": 30, "fats": 12}
+}
+
+# ------------------- CACHED FUNCTIONS ------------------- #
+@lru_cache(maxsize=None)
+def get_model_client():
+    """Rate-limited, retrying model backend with a circuit breaker, shared by every session"""
+    return ResilientBackend(
+        make_backend(MODEL_BACKEND, GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY, timeout=MODEL_TIMEOUT),
+        limiter=TokenBucket(MODEL_RATE_PER_SECOND, MODEL_BURST),
+        breaker=CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS),
+        retries=MODEL_RETRIES
+    )
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    """One on-disk response cache per process, shared by all sessions"""
+    return ResponseCache(RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
+
+@lru_cache(maxsize=None)
+def get_phash_index():
+    """Near-duplicate index of analyzed images, loaded once per process"""
+    return PerceptualIndex(PHASH_INDEX_PATH, max_distance=PHASH_MAX_DISTANCE)
+
+@lru_cache(maxsize=None)
+def get_food_store():
+    """Food table loaded once per process; FOOD_DATABASE if no table file is present"""
+    if os.path.exists(FOOD_STORE_PATH):
+        return FoodStore.load(FOOD_STORE_PATH)
+    return FoodStore.from_records(FOOD_DATABASE)
+
+@lru_cache(maxsize=None)
+def get_meal_log():
+    """Every user's logged meals and daily totals, shared by all sessions"""
+    return MealLog(MEAL_LOG_PATH)
+
+@lru_cache(maxsize=None)
+def get_name_index():
+    """Trigram index over the food store's names"""
+    return TrigramIndex(get_food_store().names)
+
+@lru_cache(maxsize=None)
+def get_inflight():
+    """Process-wide single-flight registry: identical concurrent requests share one model call"""
+    return SingleFlight()
+
+@stage("model.response")
+def get_gemini_response(backend, prompt, image=None, generation_config=None, validate=None, retries=0):
+    """Cached model call keyed on backend, prompt and image content; returns the response text.
+    Concurrent identical calls from any session are coalesced into one model request.
+    If validate is given, a response it rejects (by raising) is retried and never cached."""
+    config_key = json.dumps(generation_config, sort_keys=True) if generation_config else ""
+    key = make_key(backend.name, prompt + config_key, image.digest if image is not None else None)
+    cached = get_response_cache().get(key)
+    instrumentation.record_cache("response_cache", hit=cached is not None)
+    if cached is not None:
+        return cached
+    return get_inflight().do(key, _fetch_response, key, backend, prompt, image, generation_config, validate, retries)
+
+def _fetch_response(key, backend, prompt, image, generation_config, validate, retries):
+    # Another process (or a leader that just finished) may have filled the cache meanwhile
+    cached = get_response_cache().get(key)
+    if cached is not None:
+        return cached
+    instrumentation.record_bytes("prompt", len(prompt))
+    for attempt in range(retries + 1):
+        if image is not None:
+            with instrumentation.span("model.vision", model=backend.name, attempt=attempt):
+                text = backend.vision(prompt, image.blob, generation_config)
+        else:
+            with instrumentation.span("model.generate", model=backend.name, attempt=attempt):
+                text = backend.generate(prompt, generation_config)
+        instrumentation.record_bytes("response", len(text))
+        if validate is None:
+            break
+        try:
+            validate(text)
+            break
+        except ParseError:
+            if attempt == retries:
+                raise
+    if text.strip():  # a blank answer would otherwise be served from the cache for the whole TTL
+        get_response_cache().set(key, text)
+    return text
+
+def stream_gemini_response(backend, prompt):
+    """Streaming variant of get_gemini_response: yields text chunks as they arrive.
+    A cache hit yields the whole text at once; a completed, non-blank stream is cached. If the same
+    prompt is already in flight elsewhere, waits for it and yields its text."""
+    key = make_key(backend.name, prompt)
+    cached = get_response_cache().get(key)
+    instrumentation.record_cache("response_cache", hit=cached is not None)
+    if cached is not None:
+        yield cached
+        return
+    future, leader = get_inflight().begin(key)
+    if not leader:
+        yield future.result()
+        return
+    chunks = []
+    instrumentation.record_bytes("prompt", len(prompt))
+    try:
+        with instrumentation.span("model.stream", model=backend.name):
+            for chunk in backend.stream(prompt):
+                chunks.append(chunk)
+                yield chunk
+    except BaseException as e:
+        get_inflight().finish(key, error=e if isinstance(e, Exception) else RuntimeError("stream abandoned"))
+        raise
+    text = "".join(chunks)
+    instrumentation.record_bytes("response", len(text))
+    if text.strip():
+        get_response_cache().set(key, text)
+    get_inflight().finish(key, text)
+
+def portion_factor(serving_g, weight=None, quantity=None):
+    """Multiplier from the reference portion to what the user ate"""
+    grams = weight if weight else quantity * serving_g
+    return grams / REFERENCE_GRAMS
+
+def scale_macros(macros, factor):
+    return {key: int(round(value * factor)) for key, value in macros.items()}
+
+# ------------------- IMAGE HANDLING ------------------- #
+@lru_cache(maxsize=None)
+def get_payload_cache():
+    """Encoded upload payloads shared by all sessions"""
+    return PayloadCache(max_bytes=IMAGE_CACHE_MAX_BYTES)
+
+@lru_cache(maxsize=None)
+def get_session_store():
+    """Thumbnails and content hashes of every session's uploads, within one memory budget"""
+    return SessionStore(max_bytes=SESSION_STORE_MAX_BYTES, session_max_bytes=SESSION_MAX_BYTES)
+
+def cached_upload(cache_key):
+    """A previously prepared upload from the shared payload cache, or None if it was evicted"""
+    return cached_image(get_payload_cache(), cache_key)
+
+def session_upload(session_id, key, read):
+    """(PreparedImage, SessionEntry) for upload ``key`` of a session. Reruns find the entry and
+    rebuild the image from the shared payload cache, without reading, hashing or decoding the
+    raw upload again; ``read()`` returns the raw bytes when that is unavoidable."""
+    store = get_session_store()
+    entry = store.get(session_id, key)
+    prepared = cached_upload(entry.payload_key) if entry is not None else None
+    if prepared is None:
+        prepared = prepare_upload(read())
+        if entry is None or entry.digest != prepared.digest:
+            entry = store.put(session_id, key, prepared.digest, prepared.cache_key, phash(prepared.image),
+                              encode_thumbnail(prepared.image, THUMBNAIL_EDGE))
+    return prepared, entry
+
+@stage("image.prepare")
+def prepare_upload(data):
+    """In-memory preprocessing of raw image bytes: EXIF orientation, downsampling and size-bounded re-encode"""
+    prepared = prepare_image(data, cache=get_payload_cache(),
+                             max_edge=IMAGE_MAX_EDGE, max_bytes=IMAGE_MAX_BYTES, fmt=IMAGE_FORMAT)
+    instrumentation.record_bytes("upload", len(data))
+    instrumentation.record_bytes("image_payload", len(prepared.payload))
+    return prepared
+
+# ------------------- PARALLEL PROCESSING ------------------- #
+def nutrition_prompt():
+    # Always asks for a fixed reference portion so the answer can be cached per image
+    # and rescaled locally whenever the user changes the weight or servings
+    return (
+        f"You are a nutritionist AI. The user uploaded a food image. Estimate nutritional values for "
+        f"{REFERENCE_GRAMS} g of this food without giving any ranges. Respond with a JSON object with these fields: "
+        "food_name (a name for this food item), calories (kcal), protein (g), carbs (g), fats (g), "
+        "vitamins (notable vitamins/minerals, comma separated) and serving_g (weight in grams of one typical serving)."
+    )
+
+@stage("model.vision_batch")
+def analyze_food_parallel(backend, images, max_workers=BATCH_CONCURRENCY, on_done=None):
+    """Nutrition prompt for many images with at most max_workers model calls in flight.
+    Returns response texts in input order; a failed image yields its exception instead."""
+    results = [None] * len(images)
+    if not images:
+        return results
+    prompt = nutrition_prompt()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as executor:
+        futures = {
+            executor.submit(get_gemini_response, backend, prompt, image, NUTRITION_GENERATION_CONFIG,
+                            lambda text: parse_nutrition(text, REFERENCE_GRAMS), NUTRITION_PARSE_RETRIES): i
+            for i, image in enumerate(images)
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+            if on_done:
+                on_done(done, len(images))
+    return results
+
+def lookup_known_dish(dish_name):
+    """Fast path: answer from the food store when a typed dish name matches confidently"""
+    if not dish_name or not dish_name.strip():
+        return None
+    matches = get_name_index().search(dish_name)
+    if not matches or matches[0][1] < FAST_PATH_MIN_SCORE:
+        return None
+    row = matches[0][0]
+    store = get_food_store()
+    serving_g = float(store.serving_g[row]) or REFERENCE_GRAMS
+    # The store holds per-serving values; results are kept at the reference portion
+    per_reference = {c: int(round(float(v) * REFERENCE_GRAMS / serving_g))
+                     for c, v in zip(("calories", "protein", "carbs", "fats"), store.macros[row])}
+    food_name = str(store.names[row])
+    return {
+        "portion": REFERENCE_PORTION,
+        "nutrition_text": json.dumps({"food_name": food_name, **per_reference, "vitamins": "None", "serving_g": serving_g}),
+        "macros": per_reference,
+        "serving_g": serving_g,
+        "food_name": food_name,
+        "vitamins": "None",
+        "source": "food database"
+    }
+
+@stage("analyze_images")
+def analyze_images(backend, prepared_images, dish_names=None, max_workers=BATCH_CONCURRENCY, on_done=None,
+                   hashes=None):
+    """Tiered analysis: a confident match on a typed dish name against the food store, then a
+    near-duplicate hit, and only then one bounded fan-out of vision calls for the rest.
+    Returns one dict per image with nutrition_text, reference-portion macros, serving_g,
+    food_name, vitamins and source (or error). Perceptual hashes already known (e.g. from
+    the session store) can be passed to skip decoding the images."""
+    results = [None] * len(prepared_images)
+    dish_names = dish_names or [None] * len(prepared_images)
+    hashes = hashes or [phash(p.image) for p in prepared_images]
+    misses = []
+    for i, image_hash in enumerate(hashes):
+        # A name the user typed wins over whatever a similar photo was identified as before
+        known = lookup_known_dish(dish_names[i])
+        if dish_names[i]:
+            instrumentation.record_cache("food_store_name", hit=known is not None)
+        if known:
+            results[i] = known
+            continue
+        # Reuse the analysis of a visually near-identical image
+        match = get_phash_index().nearest(image_hash, where=lambda v: v.get("portion") == REFERENCE_PORTION)
+        instrumentation.record_cache("phash_index", hit=match is not None)
+        if match:
+            results[i] = {**match[1], "source": "near-duplicate"}
+        else:
+            misses.append(i)
+
+    texts = analyze_food_parallel(backend, [prepared_images[i] for i in misses], max_workers, on_done)
+    for i, text in zip(misses, texts):
+        if isinstance(text, Exception):
+            results[i] = {"error": str(text), "unavailable": isinstance(text, CircuitOpenError) or is_transient(text)}
+            continue
+        with instrumentation.span("parse.nutrition"):
+            record = parse_nutrition(text, REFERENCE_GRAMS)  # validated before it was cached
+        results[i] = {
+            "portion": REFERENCE_PORTION,
+            "nutrition_text": text,
+            "macros": record.macros,
+            "serving_g": record.serving_g,
+            "food_name": record.food_name,
+            "vitamins": record.vitamins,
+            "source": "model"
+        }
+        get_phash_index().add(hashes[i], results[i])
+    return results
+
+def batch_results_frame(names, results, weight=None, quantity=None):
+    """One row per analyzed image, scaled to the given portion"""
+    df = parse_many([r.get("nutrition_text") for r in results], REFERENCE_GRAMS)
+    df.insert(0, "file", names)
+    df["error"] = [r.get("error") or e for r, e in zip(results, df["error"])]
+    grams = weight if weight else quantity * df["serving_g"]
+    macro_cols = ["calories", "protein", "carbs", "fats"]
+    df[macro_cols] = df[macro_cols].mul(grams / REFERENCE_GRAMS, axis=0).round()
+    return df.drop(columns="serving_g")
+
+# ------------------- AI FUNCTIONS ------------------- #
+def healthier_option_prompt(food_name, macros, alternatives_text):
+    return f"""
+You are a professional nutritionist. A user ate {food_name} with this nutritional profile per serving:
+- Calories: {macros['calories']} kcal
+- Protein: {macros['protein']} g
+- Carbs: {macros['carbs']} g
+- Fats: {macros['fats']} g
+
+These healthier alternatives were selected for them:
+{alternatives_text}
+
+For each alternative, write one short sentence explaining why it is a healthier choice than {food_name}.
+Respond in bullet points starting with the food name.
+"""
+
+def find_healthier_alternatives(macros, food_name, k=ALTERNATIVES_COUNT):
+    """Local recommender: lower-calorie, lower-fat foods from the store, no model call"""
+    store = get_food_store()
+    return store.frame(store.healthier_alternatives(macros, k=k, exclude=food_name))
+
+def format_alternatives(alternatives):
+    return "\n".join(
+        f"- 🍎 **{row.Food}**: {row.Calories:.0f} kcal, Protein {row.Protein:.0f} g, "
+        f"Carbs {row.Carbs:.0f} g, Fats {row.Fats:.0f} g"
+        for row in alternatives.itertuples()
+    )
+
+def food_details_prompt(food_name, macros, vitamins):
+    return f"""
+You are a professional nutritionist analyzing {food_name}. Provide detailed information about this food including:
+
+1. **Cultural Origins**: Where does this dish originate from? What cultures traditionally eat it?
+2. **Typical Ingredients**: List the main ingredients typically found in this dish
+3. **Health Benefits**: Based on its nutritional profile (Calories: {macros['calories']} kcal, Protein: {macros['protein']}g, Carbs: {macros['carbs']}g, Fats: {macros['fats']}g, Vitamins/Minerals: {vitamins}), what are the key health benefits?
+4. **Potential Concerns**: Are there any potential health concerns with consuming this food regularly?
+5. **Diet Compatibility**: Is this food suitable for: Vegetarian, Vegan, Keto, Gluten-free, Dairy-free diets?
+
+Format your response with clear headings for each section.
+"""
+
+def recipe_prompt(food_name):
+    return f"""
+You are a professional chef specializing in healthy cooking. Provide:
+
+1. **Traditional Recipe**: A classic recipe for {food_name} with ingredients and step-by-step instructions
+2. **Healthier Variation**: A modified, healthier version of {food_name} with reduced calories/fats
+3. **Dietary Adaptations**: How to adapt this recipe for: Vegetarian, Vegan, Keto, Gluten-free diets
+
+Format your response with clear headings and bullet points for ingredients and numbered steps for instructions.
+Include approximate preparation and cooking times.
+"""
+
+COMBINED_SECTION_INSTRUCTIONS = {
+    "details": ("cultural origins, typical ingredients, health benefits given its nutritional profile, potential "
+                "concerns with regular consumption, and whether it suits vegetarian, vegan, keto, gluten-free and "
+                "dairy-free diets, with a clear heading for each."),
+    "recipes": ("a traditional recipe, a healthier variation with fewer calories/fats, and adaptations for vegetarian, "
+                "vegan, keto and gluten-free diets, with bulleted ingredients, numbered steps and approximate "
+                "preparation and cooking times."),
+    "alternatives": ("for each alternative above, a bullet starting with the food name and one short sentence on "
+                     "why it is a healthier choice."),
+}
+
+def combined_prompt(food_name, macros, vitamins, sections, alternatives_text=None):
+    """One prompt for several follow-up sections: the food and its macros are stated once"""
+    lines = [
+        f"You are a professional nutritionist and chef. A user ate {food_name} with this nutritional profile per serving: "
+        f"Calories {macros['calories']} kcal, Protein {macros['protein']} g, Carbs {macros['carbs']} g, "
+        f"Fats {macros['fats']} g, Vitamins/Minerals: {vitamins}."
+    ]
+    if "alternatives" in sections:
+        lines.append(f"These healthier alternatives were selected for them:\n{alternatives_text}")
+    lines.append("Respond with a JSON object with one Markdown string per field:")
+    lines += [f"- {section}: {COMBINED_SECTION_INSTRUCTIONS[section]}" for section in sections]
+    return "\n".join(lines)
+
+def combined_generation_config(sections):
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": {"type": "object", "properties": {s: {"type": "string"} for s in sections},
+                            "required": list(sections)},
+    }
+
+def split_sections(text, sections):
+    """Section -> Markdown from a combined response; missing, empty or non-string fields are left out.
+    Raises ParseError when the response is not a JSON object at all."""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ParseError(f"combined response is not JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise ParseError("combined response is not a JSON object")
+    return {s: data[s].strip() for s in sections if isinstance(data.get(s), str) and data[s].strip()}
+
+@stage("followup.combined")
+def fetch_combined_sections(backend, food_name, macros, vitamins, prompts, alternatives_text=None):
+    """One model call for every section in ``prompts`` (section -> its own prompt) that is not
+    cached yet. Each section's text is cached under its own prompt's key, so a later
+    per-section call (or another session) hits it. Returns section -> text for the sections
+    that were cached or came back well-formed; the caller falls back for the rest."""
+    cache = get_response_cache()
+    keys = {section: make_key(backend.name, prompt) for section, prompt in prompts.items()}
+    texts = {}
+    for section, key in keys.items():
+        cached = cache.get(key)
+        instrumentation.record_cache("response_cache", hit=cached is not None)
+        if cached is not None:
+            texts[section] = cached
+    missing = [section for section in prompts if section not in texts]
+    if not missing:
+        return texts
+    try:
+        response = get_gemini_response(backend, combined_prompt(food_name, macros, vitamins, missing, alternatives_text),
+                                       generation_config=combined_generation_config(missing),
+                                       validate=lambda t: split_sections(t, missing))
+    except ParseError:
+        return texts
+    for section, text in split_sections(response, missing).items():
+        cache.set(keys[section], text)
+        texts[section] = text
+    return texts
+
+# ------------------- FOLLOW-UP ORCHESTRATION ------------------- #
+@lru_cache(maxsize=None)
+def get_followup_pool():
+    """Keyed thread pool shared by all sessions for follow-up prompts. A prompt already in
+    flight (from a prefetch, another session or the run a rerun interrupted) is attached to
+    rather than submitted again."""
+    return TaskPool(FOLLOWUP_WORKERS, PREFETCH_MAX_PENDING, name="followup")
+
+class StreamBuffer:
+    """Text received so far for one streaming follow-up"""
+    def __init__(self):
+        self.chunks = []
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+# Each follow-up is timed as its own stage, e.g. "followup.details"
+def _consume_stream(backend, prompt, buffer, section):
+    with instrumentation.span(f"followup.{section}", model=backend.name):
+        for chunk in stream_gemini_response(backend, prompt):
+            buffer.chunks.append(chunk)
+    return buffer.text
+
+def _fetch_into(backend, prompt, buffer, section):
+    with instrumentation.span(f"followup.{section}", model=backend.name):
+        text = get_gemini_response(backend, prompt)
+    buffer.chunks.append(text)
+    return text
+
+def _chain(source, target, buffer):
+    def copy(done):
+        if done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            buffer.chunks[:] = [done.result()]
+            target.set_result(done.result())
+    source.add_done_callback(copy)
+
+class AnalysisTasks:
+    """Follow-up prompts for one analysis, each distinct prompt in flight at most once per process"""
+    def __init__(self, backend, pool, stream=False, speculative=False):
+        self.backend = backend
+        self.pool = pool
+        self.stream = stream
+        self.speculative = speculative
+
+    def _submit(self, section, prompt, speculative):
+        buffer = StreamBuffer()
+        return self.pool.submit((self.backend.name, prompt), _consume_stream if self.stream else _fetch_into,
+                                self.backend, prompt, buffer, section, context=buffer, speculative=speculative)
+
+    def submit(self, section, prompt):
+        """Returns (future, buffer), or None if a speculative submission was dropped.
+        The buffer fills incrementally in streaming mode and at once otherwise."""
+        return self._submit(section, prompt, self.speculative)
+
+    def submit_combined(self, prompts, fetch):
+        """One combined call for all sections in ``prompts`` (section -> its own prompt); ``fetch(prompts)``
+        returns section -> text and the sections it leaves out are submitted on their own.
+        Returns section -> (future, buffer) like submit, or None if dropped. Combined answers
+        arrive whole, not streamed."""
+        results = {section: (concurrent.futures.Future(), StreamBuffer()) for section in prompts}
+
+        def run():
+            # Sections already in flight on their own (e.g. fallbacks of an interrupted run) are attached to
+            todo = {s: p for s, p in prompts.items() if (self.backend.name, p) not in self.pool}
+            try:
+                texts = fetch(todo) if todo else {}
+            except Exception as e:
+                for future, _ in results.values():
+                    future.set_exception(e)
+                return
+            for section, (future, buffer) in results.items():
+                if section in texts:
+                    buffer.chunks.append(texts[section])
+                    future.set_result(texts[section])
+                else:
+                    # Never dropped: someone may already be waiting on this section
+                    _chain(self._submit(section, prompts[section], speculative=False)[0], future, buffer)
+
+        # The section futures are resolved by run() rather than by pool tasks waiting on it,
+        # so a busy pool cannot deadlock on itself
+        entry = self.pool.submit((self.backend.name, "combined", *prompts.values()), run,
+                                 context=results, speculative=self.speculative)
+        return entry[1] if entry else None
+
+def start_followups(backend, food_name, macros, vitamins, alternatives_text=None, stream=False, mode=None,
+                    speculative=False):
+    """Kick off every follow-up section concurrently; returns section -> (future, buffer).
+    The alternatives explanation is only requested when alternatives_text is given.
+    ``mode`` (default FOLLOWUP_MODE) "combined" asks for all sections in one model call.
+    Speculative submissions may be dropped when the pool is busy and are left out of the result."""
+    tasks = AnalysisTasks(backend, get_followup_pool(), stream=stream, speculative=speculative)
+    prompts = {
+        "details": food_details_prompt(food_name, macros, vitamins),
+        "recipes": recipe_prompt(food_name),
+    }
+    if alternatives_text:
+        prompts["alternatives"] = healthier_option_prompt(food_name, macros, alternatives_text)
+    if (mode or FOLLOWUP_MODE) == "combined":
+        return tasks.submit_combined(prompts, lambda todo: fetch_combined_sections(
+            backend, food_name, macros, vitamins, todo, alternatives_text)) or {}
+    followups = {section: tasks.submit(section, prompt) for section, prompt in prompts.items()}
+    return {section: entry for section, entry in followups.items() if entry is not None}
+
+def followup_inputs(result):
+    """(per-serving macros, alternatives text) for the follow-ups of an analysis result; the
+    follow-ups describe one serving, so the portion eaten does not change (or re-issue) them"""
+    serving_macros = scale_macros(result["macros"], result["serving_g"] / REFERENCE_GRAMS)
+    return serving_macros, format_alternatives(find_healthier_alternatives(serving_macros, result["food_name"]))
+
+def prefetch_followups(backend, result, explain_alternatives=False, mode=None):
+    """Speculatively start the follow-up sections for an analysis result (e.g. a dish the user
+    has typed but not yet photographed) without waiting for them. Their answers land in the
+    response cache, and a page that asks for them while they are running attaches to them.
+    Nothing is started when prefetching is off or the follow-up pool is saturated."""
+    if not PREFETCH_FOLLOWUPS:
+        return {}
+    serving_macros, alternatives_text = followup_inputs(result)
+    return start_followups(backend, result["food_name"], serving_macros, result["vitamins"],
+                           alternatives_text=alternatives_text if explain_alternatives else None,
+                           stream=True, mode=mode, speculative=True)
+
+NO_ALTERNATIVES_TEXT = "No lower-calorie, lower-fat alternatives found."
+REPORT_SECTIONS = (
+    ("alternatives", "### 🍽 Healthier Alternative Suggestions:"),
+    ("alternatives_explanation", "### 💡 Why These Alternatives"),
+    ("details", "## 🍲 Detailed Food Analysis"),
+    ("recipes", "## 👨‍🍳 Recipe Suggestions"),
+)
+
+@stage("report.generate")
+def generate_report(name, macros, sections, date=None):
+    """Markdown report for one meal, assembled from section texts that are already available
+    (alternatives, alternatives_explanation, details, recipes); missing sections are left out.
+    Never calls the model."""
+    calorie_pct = macros['calories'] / DAILY_CALORIES * 100
+    protein_pct = macros['protein'] / DAILY_MACROS['protein'] * 100
+    carbs_pct = macros['carbs'] / DAILY_MACROS['carbs'] * 100
+    fats_pct = macros['fats'] / DAILY_MACROS['fats'] * 100
+
+    suggestions = []
+    if fats_pct > 70:
+        suggestions.append("🔁 Try reducing the oil or butter used during cooking.")
+    if carbs_pct > 80:
+        suggestions.append("🥗 Consider pairing with a low-carb side like salad or sautéed greens.")
+    if calorie_pct > 60:
+        suggestions.append("🔥 Opt for grilling or steaming instead of frying.")
+    if protein_pct < 40:
+        suggestions.append("💪 Add a boiled egg, lentils, or a protein shake to boost protein intake.")
+
+    suggestions_text = "\n".join(suggestions) if suggestions else "✅ This meal looks balanced for your goals!"
+    section_text = "\n\n".join(f"{heading}\n{sections[key]}" for key, heading in REPORT_SECTIONS if sections.get(key))
+    date = date or datetime.datetime.now()
+
+    return f"""
+# Nutrition Report — {name}
+Date: {date.strftime('%Y-%m-%d %H:%M')}
+
+## Nutritional Breakdown
+- Calories: {macros['calories']} kcal ({calorie_pct:.1f}% of daily need)
+- Protein: {macros['protein']} g ({protein_pct:.1f}%)
+- Carbs: {macros['carbs']} g ({carbs_pct:.1f}%)
+- Fats: {macros['fats']} g ({fats_pct:.1f}%)
+
+## Healthier Suggestions
+{suggestions_text}
+
+{section_text}
+
+"""
+
+# ------------------- HEADLESS ENTRY POINTS ------------------- #
+def log_analysis(user_id, image_hash, result, weight=None, quantity=None):
+    """Log one successful analysis to the meal log at the portion eaten; returns the meal id"""
+    factor = portion_factor(result["serving_g"], weight, quantity)
+    return get_meal_log().add(user_id, result["food_name"], scale_macros(result["macros"], factor),
+                              grams=factor * REFERENCE_GRAMS, image_hash=image_hash, source=result["source"])
+
+def analyze_bytes(images, dish_names=None, weight=None, quantity=None, max_workers=BATCH_CONCURRENCY, backend=None,
+                  user_id=None):
+    """Raw image bytes in, one JSON-serializable result per image out, scaled to the given
+    weight in grams or number of servings (one serving if neither is given). With a user_id,
+    each successful analysis is also logged to that user's meal log."""
+    if any(v is not None and not (math.isfinite(v) and v > 0) for v in (weight, quantity)):
+        raise ValueError(f"weight and quantity must be finite numbers greater than 0, got {weight!r}, {quantity!r}")
+    backend = backend or get_model_client()
+    if not weight and not quantity:
+        quantity = 1
+    prepared_images = [prepare_upload(data) for data in images]
+    results = analyze_images(backend, prepared_images, dish_names, max_workers)
+    out = []
+    for prepared, result in zip(prepared_images, results):
+        if "error" in result:
+            out.append({"image_hash": prepared.digest, "error": result["error"], "unavailable": result["unavailable"]})
+            continue
+        factor = portion_factor(result["serving_g"], weight, quantity)
+        out.append({
+            "image_hash": prepared.digest,
+            "food_name": result["food_name"],
+            "vitamins": result["vitamins"],
+            "source": result["source"],
+            "serving_g": result["serving_g"],
+            "grams": round(factor * REFERENCE_GRAMS, 1),
+            "macros": scale_macros(result["macros"], factor),
+            "serving_macros": scale_macros(result["macros"], result["serving_g"] / REFERENCE_GRAMS),
+            "nutrition_text": result["nutrition_text"],
+        })
+        if user_id is not None:
+            out[-1]["meal_id"] = log_analysis(user_id, prepared.digest, result, weight, quantity)
+    return out
+
+def followup_sections(result, explain_alternatives=False, backend=None, timeout=None, mode=None):
+    """Alternatives, details, recipes and the report for one analyze_bytes() result,
+    waiting for the follow-up prompts to finish (``mode`` as in start_followups)"""
+    backend = backend or get_model_client()
+    food_name, serving_macros = result["food_name"], result["serving_macros"]
+    alternatives_text = format_alternatives(find_healthier_alternatives(serving_macros, food_name))
+    followups = start_followups(backend, food_name, serving_macros, result["vitamins"],
+                                alternatives_text=alternatives_text if explain_alternatives else None, mode=mode)
+    sections = {"alternatives": alternatives_text or NO_ALTERNATIVES_TEXT}
+    for section, (future, _) in followups.items():
+        try:
+            text = future.result(timeout=timeout)
+        except Exception as e:
+            text = None
+            sections[f"{section}_error"] = f"{type(e).__name__}: {e}"
+        sections["alternatives_explanation" if section == "alternatives" else section] = text
+    sections["report"] = generate_report(food_name, result["macros"], sections)
+    return sections
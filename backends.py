@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Iterator, Protocol
+
+import instrumentation
+
+# ------------------- MODEL BACKENDS ------------------- #
+# Everything the app needs from a model, as plain text in and text out. The
+# analysis code only sees this interface, so it can run against Gemini, a
+# deterministic local fake, or a recorded cassette.
+
+
+class ModelBackend(Protocol):
+    name: str
+
+    def generate(self, prompt, generation_config=None) -> str:
+        ...
+
+    def stream(self, prompt, generation_config=None) -> Iterator[str]:
+        ...
+
+    def vision(self, prompt, image, generation_config=None) -> str:
+        """``image`` is an inline blob: {"mime_type": ..., "data": bytes}"""
+        ...
+
+
+class GeminiBackend:
+    """Google Gemini via google-generativeai, imported on first use"""
+
+    def __init__(self, model_name, api_key=None, timeout=None, client_options=None, transport=None):
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set; set it, or MODEL_BACKEND=fake to run offline")
+        import google.generativeai as genai
+
+        options = {}
+        if client_options:
+            options["client_options"] = client_options
+        if transport:
+            options["transport"] = transport
+        genai.configure(api_key=api_key, **options)
+        self.name = model_name
+        self.timeout = timeout
+        self._model = genai.GenerativeModel(model_name)
+
+    def _kwargs(self, generation_config):
+        kwargs = {}
+        if generation_config:
+            kwargs["generation_config"] = generation_config
+        if self.timeout:
+            kwargs["request_options"] = {"timeout": self.timeout}
+        return kwargs
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            instrumentation.record_tokens(self.name, usage.prompt_token_count, usage.candidates_token_count)
+
+    def generate(self, prompt, generation_config=None):
+        response = self._model.generate_content(prompt, **self._kwargs(generation_config))
+        self._record_usage(response)
+        return response.text
+
+    def stream(self, prompt, generation_config=None):
+        chunk = None
+        for chunk in self._model.generate_content(prompt, stream=True, **self._kwargs(generation_config)):
+            yield chunk.text
+        # Usage is reported on the final chunk
+        if chunk is not None:
+            self._record_usage(chunk)
+
+    def vision(self, prompt, image, generation_config=None):
+        response = self._model.generate_content([prompt, image], **self._kwargs(generation_config))
+        self._record_usage(response)
+        return response.text
+
+
+# ------------------- LOCAL FAKE ------------------- #
+class FakeBackendError(ConnectionError):
+    """Injected failure; ``code`` 429 so it is treated as a transient rate limit"""
+    code = 429
+
+
+_FAKE_DISHES = (
+    ("Chicken Biryani", 140, 6, 18, 5, "Iron, Vitamin B6", 250),
+    ("Masala Dosa", 178, 3, 28, 6, "Potassium, Folate", 180),
+    ("Cheeseburger", 250, 11, 18, 14, "Calcium, Zinc", 220),
+    ("Caesar Salad", 175, 6, 10, 13, "Vitamin A, Vitamin K", 200),
+    ("Grilled Salmon", 235, 21, 0, 16, "Vitamin D, Omega-3", 170),
+)
+
+
+class FakeBackend:
+    """Deterministic canned responses in the formats the app parses, with injectable
+    latency (seconds, plus optional jitter) and error rate"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, chunk_size=80, seed=0, name="fake"):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _wait_and_maybe_fail(self, latency):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+            delay = latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeBackendError("injected rate limit (429)")
+
+    def _dish(self, data):
+        return _FAKE_DISHES[int.from_bytes(hashlib.sha256(data).digest()[:4], "big") % len(_FAKE_DISHES)]
+
+    def _nutrition(self, data, generation_config):
+        name, calories, protein, carbs, fats, vitamins, serving_g = self._dish(data)
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            return json.dumps({"food_name": name, "calories": calories, "protein": protein, "carbs": carbs,
+                               "fats": fats, "vitamins": vitamins, "serving_g": serving_g})
+        return (f"- **Calories**: {calories} kcal\n- **Protein**: {protein} g\n- **Carbs**: {carbs} g\n"
+                f"- **Fats**: {fats} g\n- **Notable Vitamins/Minerals**: {vitamins}\n"
+                f"- **Serving Size**: {serving_g} g\n**Food Name**: {name}")
+
+    def _text(self, prompt, generation_config):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        markdown = (f"### Canned response {digest}\n\n"
+                    "- **Calories**: a balanced portion keeps energy intake in check.\n"
+                    "- **Protein**: pair with lean protein to stay full longer.\n"
+                    "- **Tip**: prefer grilling or steaming over frying.\n")
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            # One canned Markdown string per field of an object schema (e.g. combined follow-up sections)
+            fields = (generation_config.get("response_schema") or {}).get("properties") or {"text": None}
+            return json.dumps({field: markdown.replace(digest, f"{digest} {field}") for field in fields})
+        return markdown
+
+    def _record_usage(self, prompt, text, image_tokens=0):
+        # Roughly four characters per token, as a stand-in for the usage Gemini reports
+        instrumentation.record_tokens(self.name, len(prompt) // 4 + image_tokens, len(text) // 4, estimated=True)
+
+    def generate(self, prompt, generation_config=None):
+        self._wait_and_maybe_fail(self.latency)
+        text = self._text(prompt, generation_config)
+        self._record_usage(prompt, text)
+        return text
+
+    def stream(self, prompt, generation_config=None):
+        # Latency goes to the first chunk, like a real time-to-first-token
+        self._wait_and_maybe_fail(self.latency)
+        text = self._text(prompt, generation_config)
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+        self._record_usage(prompt, text)
+
+    def vision(self, prompt, image, generation_config=None):
+        self._wait_and_maybe_fail(self.latency)
+        text = self._nutrition(image["data"], generation_config)
+        self._record_usage(prompt, text, image_tokens=258)  # Gemini bills a small image as 258 tokens
+        return text
+
+
+# ------------------- RECORD / REPLAY ------------------- #
+class CassetteMiss(LookupError):
+    """Replay found no recorded response for a request"""
+
+
+class CassetteBackend:
+    """Replays responses recorded in a JSON Lines cassette. With ``inner`` given, misses are
+    forwarded to it and recorded, so a cassette can be captured from a real session."""
+
+    def __init__(self, path, inner=None, chunk_size=80):
+        self.path = path
+        self.inner = inner
+        self.name = inner.name if inner is not None else "cassette"
+        self.chunk_size = chunk_size
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["text"]
+
+    def _key(self, prompt, image=None, generation_config=None):
+        h = hashlib.sha256(prompt.encode("utf-8"))
+        if image is not None:
+            h.update(hashlib.sha256(image["data"]).digest())
+        if generation_config:
+            h.update(json.dumps(generation_config, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def _replay_or_record(self, key, call):
+        text = self._entries.get(key)
+        if text is not None:
+            return text
+        if self.inner is None:
+            raise CassetteMiss(f"no recorded response for request {key[:12]}")
+        text = call()
+        with self._lock:
+            self._entries[key] = text
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "text": text}) + "\n")
+        return text
+
+    def generate(self, prompt, generation_config=None):
+        return self._replay_or_record(self._key(prompt, None, generation_config),
+                                      lambda: self.inner.generate(prompt, generation_config))
+
+    def stream(self, prompt, generation_config=None):
+        key = self._key(prompt, None, generation_config)
+        if key in self._entries or self.inner is None:
+            text = self._replay_or_record(key, None)
+            for i in range(0, len(text), self.chunk_size):
+                yield text[i:i + self.chunk_size]
+            return
+        chunks = []
+        for chunk in self.inner.stream(prompt, generation_config):
+            chunks.append(chunk)
+            yield chunk
+        self._replay_or_record(key, lambda: "".join(chunks))
+
+    def vision(self, prompt, image, generation_config=None):
+        return self._replay_or_record(self._key(prompt, image, generation_config),
+                                      lambda: self.inner.vision(prompt, image, generation_config))
+
+
+def make_backend(spec, model_name, api_key=None, timeout=None):
+    """Backend from a spec string:
+    "gemini[:<endpoint URL>]" (an endpoint such as a local fake server is reached over REST),
+    "fake[:latency[:error_rate]]", "cassette:<path>" (replay only)
+    or "record:<path>" (Gemini, recording into the cassette)."""
+    kind, _, arg = spec.partition(":")
+    if kind == "gemini" and arg:
+        return GeminiBackend(model_name, api_key=api_key, timeout=timeout,
+                             client_options={"api_endpoint": arg}, transport="rest")
+    if kind == "gemini":
+        return GeminiBackend(model_name, api_key=api_key, timeout=timeout)
+    if kind == "fake":
+        latency, _, error_rate = arg.partition(":")
+        return FakeBackend(latency=float(latency or 0), error_rate=float(error_rate or 0))
+    if kind == "cassette":
+        return CassetteBackend(arg)
+    if kind == "record":
+        return CassetteBackend(arg, inner=GeminiBackend(model_name, api_key=api_key, timeout=timeout))
+    raise ValueError(f"unknown model backend: {spec!r}")
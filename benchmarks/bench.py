@@ -0,0 +1,231 @@
+"""Offline benchmarks for the analysis pipeline.
+
+Runs against the local fake model backend, so no network or API key is needed:
+
+    python benchmarks/bench.py --output bench.json
+    python benchmarks/bench.py --baseline bench.json --tolerance 0.2
+
+With --baseline, each benchmark's median is compared to the saved run and the
+exit status is 1 if any is slower by more than the tolerance.
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_PATH = os.path.join(ROOT, "benchmarks", "page.py")
+
+
+# ------------------- HARNESS ------------------- #
+def measure(fn, repeat, warmup=1, setup=None):
+    """Wall time of ``fn()`` in milliseconds over ``repeat`` runs; ``setup`` runs untimed before each"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "min_ms": samples[0],
+        "p95_ms": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+    }
+
+
+def synthetic_photo(width=3024, height=4032, seed=0):
+    """Phone-camera sized JPEG with enough texture that it does not compress to nothing"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 255 // (width + height))], axis=-1)
+    noise = rng.integers(0, 48, size=(height, width, 3))
+    buf = io.BytesIO()
+    Image.fromarray((base + noise).clip(0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+# ------------------- BENCHMARKS ------------------- #
+def bench_functions(app, photo, repeat):
+    import analysis
+    from backends import FakeBackend
+
+    fake = FakeBackend()
+    json_text = fake.vision(analysis.nutrition_prompt(), {"data": photo}, analysis.NUTRITION_GENERATION_CONFIG)
+    markdown_text = fake.vision(analysis.nutrition_prompt(), {"data": photo})
+    record = analysis.parse_nutrition(json_text, analysis.REFERENCE_GRAMS)
+    food_name = record.food_name
+    macros = analysis.scale_macros(record.macros, analysis.portion_factor(250, weight=250))
+    alternatives_text = analysis.format_alternatives(analysis.find_healthier_alternatives(macros, food_name))
+    payload_cache = analysis.get_payload_cache()
+
+    def new_session():
+        payload_cache.clear()
+        analysis.get_session_store.cache_clear()
+
+    # The functions the page itself calls: parsing inside analyze_images, uploads through the session store
+    results = {}
+    results["parse_nutrition.json"] = measure(lambda: analysis.parse_nutrition(json_text, analysis.REFERENCE_GRAMS),
+                                              repeat * 20)
+    results["parse_nutrition.markdown"] = measure(
+        lambda: analysis.parse_nutrition(markdown_text, analysis.REFERENCE_GRAMS), repeat * 20)
+    results["parse_many.100"] = measure(lambda: analysis.parse_many([json_text, markdown_text] * 50,
+                                                                    analysis.REFERENCE_GRAMS), repeat)
+    results["prepare_upload.cold"] = measure(lambda: analysis.prepare_upload(photo), repeat, setup=payload_cache.clear)
+    results["prepare_upload.cached"] = measure(lambda: analysis.prepare_upload(photo), repeat * 20)
+    # First run of a session: read, hash, decode, thumbnail; a rerun rebuilds from the payload cache
+    results["session_upload.first_run"] = measure(lambda: analysis.session_upload("bench", "bench.jpg", lambda: photo),
+                                                  repeat, setup=new_session)
+    results["session_upload.rerun"] = measure(lambda: analysis.session_upload("bench", "bench.jpg", lambda: photo),
+                                              repeat * 20)
+
+    charts = {
+        "plot_macro_comparison": (app.render_macro_comparison, lambda: app.plot_macro_comparison(macros, food_name)),
+        "plot_line_comparison": (app.render_line_comparison, lambda: app.plot_line_comparison(macros, food_name)),
+        "plot_pie_chart": (app.render_pie_chart, lambda: app.plot_pie_chart(macros)),
+        "plot_calorie_comparison": (app.render_calorie_comparison, lambda: app.plot_calorie_comparison(macros, food_name)),
+    }
+    for name, (render, plot) in charts.items():
+        results[f"{name}.cold"] = measure(plot, repeat, setup=render.clear)
+        results[f"{name}.cached"] = measure(plot, repeat * 20)
+
+    results["generate_report"] = measure(
+        lambda: analysis.generate_report(food_name, macros, {"alternatives": alternatives_text}), repeat * 20)
+    return results
+
+
+def bench_page(photo_path, repeat, timeout):
+    """Full script runs through AppTest: a first run with empty caches, then reruns"""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["BENCH_IMAGE"] = photo_path
+    results = {}
+
+    def first_run():
+        at = AppTest.from_file(PAGE_PATH, default_timeout=timeout)
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"page run failed: {at.exception[0].value}")
+        return at
+
+    def reset_caches():
+        import analysis
+        import streamlit as st
+
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        analysis.get_payload_cache().clear()
+        analysis.get_session_store.cache_clear()
+        analysis.get_response_cache.cache_clear()
+        analysis.get_phash_index.cache_clear()
+        for path in (analysis.RESPONSE_CACHE_PATH, analysis.PHASH_INDEX_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+
+    results["page.first_run"] = measure(first_run, repeat, warmup=0, setup=reset_caches)
+    at = first_run()
+    results["page.rerun"] = measure(at.run, repeat)
+    return results
+
+
+# ------------------- BASELINE ------------------- #
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """Median ratio against the baseline per benchmark. A regression is a ratio above
+    1 + tolerance that is also at least ``min_delta_ms`` slower, so sub-millisecond noise is ignored"""
+    comparison = {}
+    for name, stats in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or not before["median_ms"]:
+            continue
+        ratio = stats["median_ms"] / before["median_ms"]
+        comparison[name] = {
+            "baseline_median_ms": before["median_ms"],
+            "median_ms": stats["median_ms"],
+            "ratio": ratio,
+            "regression": ratio > 1 + tolerance and stats["median_ms"] - before["median_ms"] >= min_delta_ms,
+        }
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs for the slow benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency in seconds")
+    parser.add_argument("--skip-page", action="store_true", help="skip the full AppTest page runs")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest timeout per page run")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["MODEL_BACKEND"] = f"fake:{args.latency}"
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite3")
+    os.environ["PHASH_INDEX_PATH"] = os.path.join(workdir, "phash_index.sqlite3")
+    os.environ["MEAL_LOG_PATH"] = os.path.join(workdir, "meal_log.sqlite3")  # page runs log "guest" meals
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    # Running the page outside `streamlit run` logs a warning on nearly every call
+    logging.disable(logging.WARNING)
+    photo = synthetic_photo()
+    photo_path = os.path.join(workdir, "bench.jpg")
+    with open(photo_path, "wb") as f:
+        f.write(photo)
+
+    import streamlit_app as app
+
+    results = bench_functions(app, photo, args.repeat)
+    if not args.skip_page:
+        results.update(bench_page(photo_path, args.repeat, args.timeout))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model_backend": os.environ["MODEL_BACKEND"],
+        },
+        "benchmarks": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        regressions = [name for name, c in report["comparison"].items() if c["regression"]]
+
+    for name, stats in results.items():
+        line = f"{name:36} median {stats['median_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms"
+        c = report.get("comparison", {}).get(name)
+        if c:
+            line += f"   x{c['ratio']:.2f}" + ("  REGRESSION" if c["regression"] else "")
+        print(line)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Local stand-in for the Gemini REST API, for load tests.
+
+    python benchmarks/fake_gemini.py --port 8600 --latency 1.5 --jitter 0.5 --error-rate 0.05
+
+Then point the app at it through the real google-generativeai client (REST transport):
+
+    MODEL_BACKEND=gemini:http://127.0.0.1:8600 streamlit run streamlit_app.py
+
+Answers come from the offline fake backend, so they parse like real ones. Each
+request waits --latency (plus up to --jitter) seconds, streamed answers before
+their first chunk, and --error-rate of requests get a 429 RESOURCE_EXHAUSTED.
+GET /stats returns request, error and token counts.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backends import FakeBackend, FakeBackendError  # noqa: E402
+
+
+def _request(body):
+    """(prompt, image bytes or None, generation config in the backend's snake_case) from a REST body"""
+    prompt, image = [], None
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                prompt.append(part["text"])
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline:
+                image = base64.b64decode(inline["data"])
+    config = body.get("generationConfig") or {}
+    generation_config = {"response_mime_type": config.get("responseMimeType"),
+                         "response_schema": config.get("responseSchema")} if config.get("responseMimeType") else None
+    return "".join(prompt), image, generation_config
+
+
+def _response(text, prompt_tokens, output_tokens):
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+                          "totalTokenCount": prompt_tokens + output_tokens},
+    }
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive and chunked streaming, like the real endpoint
+    server_version = "FakeGemini/1.0"
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/stats":
+            self._send_json(HTTPStatus.OK, self.server.snapshot())
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        prompt, image, generation_config = _request(body)
+        backend = self.server.backend
+        image_tokens = 258 if image is not None else 0
+        try:
+            if path.endswith(":streamGenerateContent"):
+                chunks = backend.stream(prompt, generation_config)
+                first = next(chunks)  # latency and injected errors happen here
+            elif image is not None:
+                text = backend.vision(prompt, {"data": image}, generation_config)
+            else:
+                text = backend.generate(prompt, generation_config)
+        except FakeBackendError:
+            self.server.count("rate_limited")
+            self._send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": {
+                "code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}})
+            return
+        prompt_tokens = len(prompt) // 4 + image_tokens
+        if not path.endswith(":streamGenerateContent"):
+            self.server.count("ok", prompt_tokens, len(text) // 4)
+            self._send_json(HTTPStatus.OK, _response(text, prompt_tokens, len(text) // 4))
+            return
+        # Streamed answers are one JSON array, sent element by element as chunks arrive
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        output_tokens = 0
+        for i, chunk in enumerate([first, *chunks]):
+            output_tokens += len(chunk) // 4
+            self._chunk((b"[" if i == 0 else b",") + json.dumps(_response(chunk, prompt_tokens, output_tokens)).encode("utf-8"))
+        self._chunk(b"]")
+        self._chunk(b"")
+        self.server.count("ok", prompt_tokens, output_tokens)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=1.0, jitter=0.0, error_rate=0.0, seed=0, quiet=True):
+        super().__init__(address, FakeGeminiHandler)
+        self.backend = FakeBackend(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed, name="fake-gemini")
+        self.quiet = quiet
+        self._lock = threading.Lock()
+        self._stats = {"ok": 0, "rate_limited": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def count(self, result, prompt_tokens=0, output_tokens=0):
+        with self._lock:
+            self._stats[result] += 1
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["output_tokens"] += output_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats)
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per request (to the first chunk if streamed)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = FakeGeminiServer((args.host, args.port), args.latency, args.jitter, args.error_rate, args.seed,
+                              quiet=not args.verbose)
+    print(f"fake Gemini on {server.url}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Concurrent-session load test of the Streamlit app against a local fake Gemini server.
+
+    python benchmarks/loadtest.py --sessions 1,5,10,20 --latency 1.5 --error-rate 0.05
+    python benchmarks/loadtest.py --sessions 10 --iterations 3 --output load.json
+
+For each concurrency level a fresh worker process plays one app instance: N
+sessions run side by side through Streamlit's AppTest, each uploading a photo,
+changing the portion, switching chart tabs and switching to servings, for
+--iterations photos. The model is benchmarks/fake_gemini.py, reached through
+the real Gemini client over HTTP, so rate limiting, retries and the circuit
+breaker behave as in production. Reports throughput, p50/p95/p99 page latency
+and CPU and RSS per session for each level.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PAGE_PATH = os.path.join(BENCH_DIR, "page.py")
+FAKE_SERVER_PATH = os.path.join(BENCH_DIR, "fake_gemini.py")
+CHART_TABS = ["Macronutrient Trend", "Calorie Comparison", "Macro Distribution", "Macronutrient Bar Chart"]
+
+
+# ------------------- MEASUREMENT ------------------- #
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))]
+
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    return {"count": len(samples), "p50_ms": percentile(samples, 0.50), "p95_ms": percentile(samples, 0.95),
+            "p99_ms": percentile(samples, 0.99), "max_ms": samples[-1] if samples else None}
+
+
+def rss_bytes():
+    """Current resident set size (Linux), falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    """Peak RSS over the run, sampled every ``interval`` seconds"""
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_bytes())
+        return self.peak
+
+
+# ------------------- WORKER (one app instance) ------------------- #
+def run_session(index, images, args, records, start_at):
+    """One simulated user; appends (step, milliseconds, ok) to records"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(index)
+    time.sleep(max(0.0, start_at - time.perf_counter()))
+    at = AppTest.from_file(PAGE_PATH, default_timeout=args.timeout)
+
+    def step(name, action):
+        start = time.perf_counter()
+        try:
+            action()
+            ok = not at.exception and not at.error and not any("unavailable" in w.value for w in at.warning)
+        except Exception:  # AppTest timeout or a widget missing after a failed run
+            ok = False
+        records.append((name, (time.perf_counter() - start) * 1000, ok))
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+        return ok
+
+    for iteration in range(args.iterations):
+        at.session_state["bench_image"] = images[(index + iteration * args.sessions) % len(images)]
+        if not step("upload", at.run):
+            continue
+        step("portion", lambda: at.sidebar.number_input[0].set_value(rng.randint(50, 500)).run())
+        for tab in CHART_TABS:
+            step("tab", lambda: next(r for r in at.radio if r.label == "Chart").set_value(tab).run())
+        step("servings", lambda: next(r for r in at.sidebar.radio if r.label == "Choose input type")
+             .set_value("By Servings").run())
+        step("weight", lambda: next(r for r in at.sidebar.radio if r.label == "Choose input type")
+             .set_value("By Weight (g)").run())
+
+
+def worker(args):
+    workdir = tempfile.mkdtemp(prefix=f"load-{args.sessions}-", dir=args.workdir)
+    os.environ.update({
+        "MODEL_BACKEND": f"gemini:{args.endpoint}",
+        "GEMINI_API_KEY": "load-test",
+        "RESPONSE_CACHE_PATH": os.path.join(workdir, "responses.sqlite3"),
+        "PHASH_INDEX_PATH": os.path.join(workdir, "phash_index.sqlite3"),
+        "MEAL_LOG_PATH": os.path.join(workdir, "meal_log.sqlite3"),
+        "BENCH_IMAGE": args.images[0],
+    })
+    if args.model_rate:
+        os.environ["MODEL_RATE_PER_SECOND"] = str(args.model_rate)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)  # AppTest outside `streamlit run` warns on nearly every call
+
+    # Import the heavy modules up front so the baseline RSS and CPU are those of a warm server
+    import warnings
+    warnings.simplefilter("ignore")
+    import charts
+    import streamlit.testing.v1  # noqa: F401
+    charts.render_pie_chart({"calories": 100, "protein": 10, "carbs": 10, "fats": 5})
+
+    records = []
+    base_rss = rss_bytes()
+    cpu_start = os.times()
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_session,
+                         args=(i, args.images, args, records, start + args.ramp * i / max(1, args.sessions - 1)))
+        for i in range(args.sessions)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    peak_rss = sampler.stop()
+    cpu_end = os.times()
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+
+    steps = {}
+    for name, ms, _ in records:
+        steps.setdefault(name, []).append(ms)
+    failures = sum(1 for _, _, ok in records if not ok)
+    return {
+        "sessions": args.sessions,
+        "wall_s": wall,
+        "steps": len(records),
+        "failures": failures,
+        "throughput_steps_per_s": len(records) / wall,
+        "uploads_per_min": len(steps.get("upload", [])) / wall * 60,
+        "latency": latency_stats([ms for _, ms, _ in records]),
+        "latency_by_step": {name: latency_stats(samples) for name, samples in steps.items()},
+        "cpu_s": cpu,
+        "cpu_s_per_session": cpu / args.sessions,
+        "cpu_utilisation": cpu / wall,
+        "rss_base_mb": base_rss / 2 ** 20,
+        "rss_peak_mb": peak_rss / 2 ** 20,
+        "rss_mb_per_session": (peak_rss - base_rss) / 2 ** 20 / args.sessions,
+    }
+
+
+# ------------------- DRIVER ------------------- #
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return json.load(response)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def make_images(count, workdir, width, height):
+    from bench import synthetic_photo
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(workdir, f"photo{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(synthetic_photo(width, height, seed=i))
+        paths.append(path)
+    return paths
+
+
+def run_level(args, sessions, images, endpoint, workdir):
+    """One concurrency level in a fresh process, so caches and RSS start from scratch"""
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--sessions", str(sessions),
+               "--endpoint", endpoint, "--workdir", workdir, "--iterations", str(args.iterations),
+               "--think", str(args.think), "--ramp", str(args.ramp), "--timeout", str(args.timeout),
+               "--model-rate", str(args.model_rate or 0), "--images", *images]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_table(levels, slo_ms):
+    header = (f"{'sessions':>8} {'steps/s':>8} {'uploads/min':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'fail':>5} {'CPU s/sess':>10} {'CPU util':>8} {'RSS MB/sess':>11} {'peak RSS MB':>11}")
+    print(header)
+    for r in levels:
+        lat = r["latency"]
+        flag = "  > SLO" if slo_ms and lat["p95_ms"] > slo_ms else ""
+        print(f"{r['sessions']:>8} {r['throughput_steps_per_s']:>8.2f} {r['uploads_per_min']:>11.1f} "
+              f"{lat['p50_ms']:>8.0f} {lat['p95_ms']:>8.0f} {lat['p99_ms']:>8.0f} {r['failures']:>5} "
+              f"{r['cpu_s_per_session']:>10.2f} {r['cpu_utilisation']:>8.0%} {r['rss_mb_per_session']:>11.1f} "
+              f"{r['rss_peak_mb']:>11.0f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,5,10", help="comma-separated concurrency levels to run")
+    parser.add_argument("--iterations", type=int, default=2, help="photos uploaded per session")
+    parser.add_argument("--distinct-images", type=int, default=0,
+                        help="distinct photos shared by all sessions (default: one per upload, so none repeat)")
+    parser.add_argument("--image-size", default="3024x4032", help="synthetic photo size, WIDTHxHEIGHT")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="extra random model latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of model requests answered with 429")
+    parser.add_argument("--model-rate", type=float, help="override the app's model requests per second")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a session's steps, seconds")
+    parser.add_argument("--ramp", type=float, default=0.0, help="spread session starts over this many seconds")
+    parser.add_argument("--timeout", type=float, default=300, help="AppTest timeout per page run")
+    parser.add_argument("--slo-p95-ms", type=float, help="flag levels whose p95 page latency exceeds this")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--endpoint", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--images", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        args.sessions = int(args.sessions)
+        print(json.dumps(worker(args)))
+        return 0
+
+    levels = [int(n) for n in args.sessions.split(",")]
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    images = make_images(args.distinct_images or max(levels) * args.iterations, workdir, width, height)
+
+    server = subprocess.Popen([sys.executable, FAKE_SERVER_PATH, "--port", "0", "--latency", str(args.latency),
+                               "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)],
+                              stderr=subprocess.PIPE, text=True)
+    try:
+        endpoint = server.stderr.readline().split()[-1]  # "fake Gemini on http://host:port"
+        wait_for(endpoint + "/stats")
+        results = []
+        for sessions in levels:
+            before = wait_for(endpoint + "/stats")
+            result = run_level(args, sessions, images, endpoint, workdir)
+            after = wait_for(endpoint + "/stats")
+            result["model"] = {k: after[k] - before[k] for k in after}
+            results.append(result)
+            print(f"{sessions} sessions: {result['steps']} steps in {result['wall_s']:.1f}s, "
+                  f"{result['model']['ok']} model calls, {result['model']['rate_limited']} rate limited",
+                  file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_table(results, args.slo_p95_ms)
+    if args.slo_p95_ms:
+        within = [r["sessions"] for r in results if r["latency"]["p95_ms"] <= args.slo_p95_ms]
+        print(f"highest level within p95 <= {args.slo_p95_ms:.0f} ms: {max(within) if within else 'none'}")
+    if args.output:
+        report = {"config": {k: v for k, v in vars(args).items() if k not in ("worker", "endpoint", "workdir", "images")},
+                  "levels": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
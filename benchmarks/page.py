@@ -0,0 +1,31 @@
+import io
+import os
+import runpy
+
+import streamlit as st
+
+# ------------------- BENCHMARK PAGE ------------------- #
+# Runs the real app with an image already "uploaded", since AppTest cannot drive
+# the file uploader. The image is st.session_state["bench_image"] if a test set
+# it (one per simulated session in the load test), else BENCH_IMAGE. Started by
+# bench.py and loadtest.py through AppTest.
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+class _Upload(io.BytesIO):
+    def __init__(self, data, path):
+        super().__init__(data)
+        self.name = os.path.basename(path)
+        self.type = "image/jpeg"
+        self.file_id = path
+
+
+def _file_uploader(label, *args, accept_multiple_files=False, **kwargs):
+    path = st.session_state.get("bench_image") or os.environ["BENCH_IMAGE"]
+    with open(path, "rb") as f:
+        upload = _Upload(f.read(), path)
+    return [upload] if accept_multiple_files else upload
+
+
+st.file_uploader = _file_uploader
+runpy.run_path(APP_PATH, run_name="__main__")
@@ -0,0 +1,140 @@
+import io
+import math
+
+from analysis import get_food_store
+
+# ------------------- CHARTS ------------------- #
+# Comparison charts as PNG bytes. Charts are drawn on standalone Figures (no pyplot
+# global state, safe across sessions and threads). matplotlib, seaborn and pandas
+# are imported on the first chart, so importing this module stays cheap.
+MACRO_PALETTE = {"Protein": "#4ECDC4", "Carbs": "#45B7D1", "Fats": "#FFC154"}
+CHART_NEIGHBOURS = 8  # most similar foods shown next to the user's
+CHART_DPI = 200
+CHART_MAX_WIDTH = 1460  # px, the widest st.image shows an image without resizing it
+CHART_PAD_INCHES = 0.1
+
+def comparison_frame(user_macros, food_name):
+    """User's food on top of the most similar foods in the store"""
+    import pandas as pd
+
+    store = get_food_store()
+    user_row = pd.DataFrame([{
+        "Food": food_name, "Calories": user_macros["calories"], "Protein": user_macros["protein"],
+        "Carbs": user_macros["carbs"], "Fats": user_macros["fats"]
+    }])
+    neighbours = store.frame(store.nearest(user_macros, k=CHART_NEIGHBOURS, exclude=food_name))
+    return pd.concat([user_row, neighbours], ignore_index=True)
+
+def new_figure(figsize, style="whitegrid"):
+    import matplotlib.style
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    with matplotlib.style.context("default"), sns.axes_style(style):
+        fig = Figure(figsize=figsize)
+        ax = fig.subplots()
+    return fig, ax
+
+def figure_png(fig):
+    # st.pyplot's settings, except that the dpi is lowered when the cropped figure would be
+    # wider than CHART_MAX_WIDTH: st.image passes narrower PNGs through untouched, but
+    # decodes, resizes and re-encodes wider ones on every rerun, cached or not
+    width = fig.get_tightbbox().width + 2 * CHART_PAD_INCHES  # inches
+    dpi = min(CHART_DPI, math.floor(CHART_MAX_WIDTH / width))
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight", pad_inches=CHART_PAD_INCHES)
+    return buffer.getvalue()
+
+def render_macro_comparison(user_macros, food_name):
+    import seaborn as sns
+
+    df = comparison_frame(user_macros, food_name)
+    df_melted = df.melt(id_vars="Food", value_vars=["Protein", "Carbs", "Fats"], var_name="Macro", value_name="Value")
+    
+    fig, ax = new_figure((12, 8))
+    sns.barplot(data=df_melted, x="Value", y="Food", hue="Macro", palette=MACRO_PALETTE, errorbar=None, ax=ax)
+    
+    # Highlight the user's food (first bar of each hue group)
+    for container in ax.containers:
+        bar = container.patches[0]
+        bar.set_edgecolor("#FF0000")
+        bar.set_linewidth(2)
+        bar.set_alpha(0.9)
+    
+    ax.set_title(f"Macronutrient Comparison: {food_name} vs Similar Foods", pad=20, fontsize=14, fontweight='bold')
+    ax.set_xlabel("Amount (g)", fontsize=12)
+    ax.set_ylabel("")
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', title="Macronutrients")
+    fig.tight_layout()
+    return figure_png(fig)
+
+def render_line_comparison(user_macros, food_name):
+    df = comparison_frame(user_macros, food_name)
+    
+    fig, ax = new_figure((14, 7))
+    ax.plot(df['Food'], df['Protein'], marker='o', markersize=8, label='Protein', 
+            color='#4ECDC4', linewidth=3, linestyle='-', alpha=0.8)
+    ax.plot(df['Food'], df['Carbs'], marker='s', markersize=8, label='Carbs', 
+            color='#45B7D1', linewidth=3, linestyle='--', alpha=0.8)
+    ax.plot(df['Food'], df['Fats'], marker='^', markersize=8, label='Fats', 
+            color='#FFC154', linewidth=3, linestyle='-.', alpha=0.8)
+    
+    ax.axvline(x=0, color='red', linestyle='--', alpha=0.5, linewidth=2)
+    
+    ax.set_title(f"Macronutrient Trend: {food_name} vs Similar Foods", fontsize=14, fontweight='bold', pad=20)
+    ax.set_xlabel("Food Items", fontsize=12)
+    ax.set_ylabel("Amount (g)", fontsize=12)
+    ax.tick_params(axis='x', labelrotation=45, labelsize=10)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.tick_params(axis='y', labelsize=10)
+    ax.legend(fontsize=12, frameon=True, shadow=True)
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return figure_png(fig)
+
+def render_pie_chart(data):
+    labels = ['Protein', 'Carbs', 'Fats']
+    values = [data.get("protein", 0), data.get("carbs", 0), data.get("fats", 0)]
+    values = [v if not math.isnan(v) else 0 for v in values]
+    
+    if sum(values) == 0:
+        return None
+    
+    fig, ax = new_figure((2, 2), style="white")
+    explode = [0.05 if v == max(values) else 0 for v in values]
+    colors = ['#FF6347', '#3CB371', '#FFD700']
+    
+    ax.pie(values, explode=explode, labels=labels, 
+           autopct='%1.1f%%', startangle=140, colors=colors,
+           textprops={'fontsize': 6}, pctdistance=0.85,
+           wedgeprops={'edgecolor': 'white', 'linewidth': 1})
+    
+    from matplotlib.patches import Circle
+
+    centre_circle = Circle((0,0),0.70,fc='white')
+    ax.add_artist(centre_circle)
+    
+    ax.axis('equal')  
+    ax.set_title('Macronutrient Distribution', fontsize=10, fontweight='bold', pad=20)
+    return figure_png(fig)
+
+def render_calorie_comparison(user_macros, food_name):
+    df = comparison_frame(user_macros, food_name)
+    colors = ["#FF6B6B"] + ["#45B7D1"] * (len(df) - 1)
+    
+    fig, ax = new_figure((12, 7))
+    bars = ax.barh(df["Food"], df["Calories"], color=colors, edgecolor='white', linewidth=0.7, alpha=0.9)
+    
+    for bar in bars:
+        width = bar.get_width()
+        ax.text(width + 10, bar.get_y() + bar.get_height()/2, 
+                f"{int(width)} kcal", ha='left', va='center',
+                fontsize=10, fontweight='bold')
+    
+    ax.set_title(f"Calorie Comparison: {food_name} vs Similar Foods", fontsize=14, fontweight='bold', pad=20)
+    ax.set_xlabel("Calories (kcal)", fontsize=12)
+    ax.set_ylabel("")
+    fig.tight_layout()
+    return figure_png(fig)
+
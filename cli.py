@@ -0,0 +1,256 @@
+"""Command line and local HTTP access to the analysis core, without Streamlit.
+
+    python cli.py analyze meal.jpg [--dish "Masala Dosa"] [--weight 250 | --servings 2] [--user me] [--followups]
+    python cli.py batch photos/            # or photos.zip; CSV on stdout or --output
+    python cli.py serve --port 8502        # POST image bytes to /analyze
+    python cli.py export --format parquet --user guest --from 2024-01-01 --output meals.parquet
+
+The model backend is chosen by MODEL_BACKEND as in the app ("fake" runs offline).
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import zipfile
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+import analysis
+import export
+import instrumentation
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+DEFAULT_USER = "guest"  # the app's default User ID
+
+
+# ------------------- INPUT ------------------- #
+def positive_number(text):
+    """A portion (grams or servings): a finite number greater than 0"""
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {text!r}") from None
+    if not (math.isfinite(value) and value > 0):
+        raise argparse.ArgumentTypeError(f"must be a finite number greater than 0: {text!r}")
+    return value
+
+
+def read_images(path):
+    """(name, bytes) for an image file, every image in a directory, or every image in a zip archive"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return [(os.path.basename(info.filename), archive.read(info)) for info in archive.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        return [(n, _read(os.path.join(path, n))) for n in names]
+    return [(os.path.basename(path), _read(path))]
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ------------------- COMMANDS ------------------- #
+def cmd_analyze(args):
+    images = [image for path in args.images for image in read_images(path)]
+    results = analysis.analyze_bytes([data for _, data in images], dish_names=[args.dish] * len(images),
+                                     weight=args.weight, quantity=args.servings, max_workers=args.concurrency,
+                                     user_id=args.user)
+    for (name, _), result in zip(images, results):
+        result["file"] = name
+        if args.followups and "error" not in result:
+            result.update(analysis.followup_sections(result, explain_alternatives=args.explain_alternatives,
+                                                     mode=args.followup_mode))
+    json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+    return 0 if all("error" not in r for r in results) else 1
+
+
+def cmd_batch(args):
+    images = read_images(args.path)
+    if not images:
+        print(f"no images found in {args.path}", file=sys.stderr)
+        return 1
+    prepared = [analysis.prepare_upload(data) for _, data in images]
+    results = analysis.analyze_images(analysis.get_model_client(), prepared, max_workers=args.concurrency,
+                                      on_done=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    quantity = args.servings if args.weight is None else None
+    for image, result in zip(prepared, results):
+        if "error" not in result:
+            analysis.log_analysis(args.user, image.digest, result, args.weight, quantity)
+    df = analysis.batch_results_frame([name for name, _ in images], results, args.weight, quantity)
+    df.to_csv(args.output or sys.stdout, index=False)
+    return 0 if df["error"].isna().all() else 1
+
+
+def cmd_export(args):
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        count = export.export_meals(analysis.get_meal_log(), args.format, out, user_id=args.user,
+                                    first_day=args.first_day, last_day=args.last_day, chunk_rows=args.chunk_rows)
+    finally:
+        if args.output:
+            out.close()
+    print(f"exported {count} meals", file=sys.stderr)
+    return 0
+
+
+class AnalyzeHandler(BaseHTTPRequestHandler):
+    """POST /analyze with the raw image as the body; query parameters dish, weight,
+    servings, user (whose meal log it goes to, default guest) and followups.
+    GET /export streams one user's meal log (query parameters user, which is
+    required, format, from and to). GET /healthz and GET /metrics (Prometheus text)."""
+
+    server_version = "FoodAnalyzer/1.0"
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send(HTTPStatus.OK, {"status": "ok", "circuit": analysis.get_model_client().breaker.state})
+        elif path == "/metrics":
+            self._send(HTTPStatus.OK, instrumentation.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+        elif path == "/export":
+            self._export({k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()})
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def _export(self, params):
+        fmt = params.get("format", "csv")
+        if fmt not in export.FORMATS:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": f"format must be one of {', '.join(export.FORMATS)}"})
+            return
+        if not params.get("user"):
+            # Everyone's history is only exported locally, through `cli.py export`
+            self._send(HTTPStatus.BAD_REQUEST, {"error": "user is required"})
+            return
+        if fmt == "parquet" and not export.parquet_available():
+            self._send(HTTPStatus.NOT_IMPLEMENTED, {"error": "Parquet export needs pyarrow on the server"})
+            return
+        try:
+            first_day, last_day = params.get("from"), params.get("to")
+            export.day_bounds(first_day, last_day)
+        except ValueError:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": "from and to must be YYYY-MM-DD"})
+            return
+        # No Content-Length: the body is streamed chunk by chunk and ends when the connection closes
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", export.FORMATS[fmt])
+        self.send_header("Content-Disposition", f'attachment; filename="meals.{fmt}"')
+        self.end_headers()
+        export.export_meals(analysis.get_meal_log(), fmt, self.wfile, user_id=params["user"],
+                            first_day=first_day, last_day=last_day)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analyze":
+            self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_UPLOAD_BYTES:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": f"body must be an image of at most {MAX_UPLOAD_BYTES} bytes"})
+            return
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            weight = positive_number(params["weight"]) if "weight" in params else None
+            servings = positive_number(params["servings"]) if "servings" in params else None
+        except argparse.ArgumentTypeError:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": "weight and servings must be finite numbers greater than 0"})
+            return
+        try:
+            result = analysis.analyze_bytes([self.rfile.read(length)], dish_names=[params.get("dish")],
+                                            weight=weight, quantity=servings,
+                                            user_id=params.get("user") or DEFAULT_USER)[0]
+        except (OSError, Image.DecompressionBombError) as e:  # PIL cannot (or will not) decode the body
+            self._send(HTTPStatus.BAD_REQUEST, {"error": f"not a readable image: {e}"})
+            return
+        if "error" in result:
+            status = HTTPStatus.SERVICE_UNAVAILABLE if result["unavailable"] else HTTPStatus.BAD_GATEWAY
+            self._send(status, result)
+            return
+        if params.get("followups") in ("1", "true", "yes"):
+            result.update(analysis.followup_sections(result))
+        self._send(HTTPStatus.OK, result)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def cmd_serve(args):
+    server = ThreadingHTTPServer((args.host, args.port), AnalyzeHandler)
+    server.quiet = args.quiet
+    print(f"serving on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_portion(p):
+        portion = p.add_mutually_exclusive_group()
+        portion.add_argument("--weight", type=positive_number, help="grams eaten")
+        portion.add_argument("--servings", type=positive_number, default=1, help="servings eaten (default 1)")
+        p.add_argument("--concurrency", type=int, default=analysis.BATCH_CONCURRENCY, help="max parallel vision calls")
+        p.add_argument("--user", default=DEFAULT_USER, help=f"meal log the analyses go to (default {DEFAULT_USER})")
+
+    p = commands.add_parser("analyze", help="analyze images and print JSON")
+    p.add_argument("images", nargs="+", help="image files, directories or zip archives")
+    p.add_argument("--dish", help="dish name; known dishes are answered from the food database")
+    p.add_argument("--followups", action="store_true", help="also fetch details, recipes and the report")
+    p.add_argument("--explain-alternatives", action="store_true", help="ask the model to explain the alternatives")
+    p.add_argument("--followup-mode", choices=("separate", "combined"),
+                   help="one prompt per follow-up section, or one JSON call for all (default: FOLLOWUP_MODE)")
+    add_portion(p)
+    p.set_defaults(func=cmd_analyze)
+
+    p = commands.add_parser("batch", help="analyze a directory or zip of images and write CSV")
+    p.add_argument("path", help="directory or zip archive of images")
+    p.add_argument("--output", help="CSV file (default: stdout)")
+    add_portion(p)
+    p.set_defaults(func=cmd_batch)
+
+    p = commands.add_parser("serve", help="serve POST /analyze over HTTP")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8502)
+    p.add_argument("--quiet", action="store_true", help="do not log requests")
+    p.set_defaults(func=cmd_serve)
+
+    p = commands.add_parser("export", help="stream the meal log as CSV, JSON Lines or Parquet")
+    p.add_argument("--format", choices=export.FORMATS, default="csv")
+    p.add_argument("--user", help="only this user's meals (default: everyone's)")
+    p.add_argument("--from", dest="first_day", type=datetime.date.fromisoformat, help="first day, YYYY-MM-DD")
+    p.add_argument("--to", dest="last_day", type=datetime.date.fromisoformat, help="last day, YYYY-MM-DD")
+    p.add_argument("--output", help="output file (default: stdout)")
+    p.add_argument("--chunk-rows", type=int, default=export.CHUNK_ROWS, help="rows read and written per chunk")
+    p.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
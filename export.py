@@ -0,0 +1,102 @@
+import csv
+import datetime
+import importlib.util
+import io
+import json
+
+from meal_log import MEAL_COLUMNS
+
+# ------------------- EXPORT ------------------- #
+# Meal history to CSV, JSON Lines or Parquet, streamed: rows are read from the
+# meal log in chunks and each chunk is encoded and written before the next one
+# is fetched, so memory stays flat however long the date range is.
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+CHUNK_ROWS = 10000
+
+
+def day_bounds(first_day=None, last_day=None):
+    """Unix timestamps from local midnight of ``first_day`` to the end of ``last_day`` (dates or ISO strings)"""
+    def midnight(day):
+        day = day if isinstance(day, datetime.date) else datetime.date.fromisoformat(day)
+        return datetime.datetime.combine(day, datetime.time()).timestamp()
+    start = midnight(first_day) if first_day else None
+    end = midnight(datetime.date.fromisoformat(str(last_day)) + datetime.timedelta(days=1)) if last_day else None
+    return start, end
+
+
+def _iso(timestamp):
+    # UTC in every format, as in the Parquet schema; ``day`` is the user's local calendar day
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def write_csv(chunks, out):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(MEAL_COLUMNS)
+    eaten_at = MEAL_COLUMNS.index("eaten_at")
+    for rows in chunks:
+        writer.writerows(row[:eaten_at] + (_iso(row[eaten_at]),) + row[eaten_at + 1:] for row in rows)
+        out.write(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+    out.write(buffer.getvalue().encode("utf-8"))  # header only, when there are no rows
+
+
+def write_jsonl(chunks, out):
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            record = dict(zip(MEAL_COLUMNS, row))
+            record["eaten_at"] = _iso(record["eaten_at"])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        out.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def parquet_available():
+    """pyarrow is optional and imported only when a Parquet export runs"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parquet_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()), ("user_id", pa.string()), ("eaten_at", pa.timestamp("ms", tz="UTC")),
+        ("day", pa.string()), ("food_name", pa.string()),
+        ("calories", pa.float64()), ("protein", pa.float64()), ("carbs", pa.float64()), ("fats", pa.float64()),
+        ("grams", pa.float64()), ("image_hash", pa.string()), ("source", pa.string()),
+    ])
+
+
+def write_parquet(chunks, out):
+    """One row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    schema = parquet_schema(pa)
+    eaten_at = MEAL_COLUMNS.index("eaten_at")
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for rows in chunks:
+            columns = [list(column) for column in zip(*rows)]
+            columns[eaten_at] = [int(ts * 1000) for ts in columns[eaten_at]]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_meals(meal_log, fmt, out, user_id=None, first_day=None, last_day=None, chunk_rows=CHUNK_ROWS):
+    """Stream one user's (or everyone's) meals between two days to the binary file ``out``; returns the row count"""
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format {fmt!r}, expected one of {', '.join(WRITERS)}")
+    start, end = day_bounds(first_day, last_day)
+    count = 0
+
+    def counted(chunks):
+        nonlocal count
+        for rows in chunks:
+            count += len(rows)
+            yield rows
+
+    WRITERS[fmt](counted(meal_log.iter_chunks(user_id, start, end, chunk_rows)), out)
+    return count
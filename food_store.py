@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+# ------------------- FOOD STORE ------------------- #
+# Columnar table of foods (macros per serving). Loaded from CSV or Parquet once,
+# then kept as memory-mapped .npy columns next to the source file so worker
+# processes share pages and later loads skip parsing entirely.
+MACRO_COLUMNS = ("calories", "protein", "carbs", "fats")
+
+
+class FoodStore:
+    """Foods as parallel NumPy columns with a nearest-neighbour index over normalized macros"""
+
+    def __init__(self, names, macros, serving_g):
+        self.names = names
+        self.macros = macros  # (n, 4) float32: calories, protein, carbs, fats
+        self.serving_g = serving_g
+        # Per-column scale so grams of fat and kcal weigh comparably in distances
+        scale = macros.std(axis=0) if len(macros) > 1 else np.ones(macros.shape[1])
+        self.scale = np.where(scale > 0, scale, 1).astype(np.float32)
+        self.vectors = np.ascontiguousarray(macros / self.scale, dtype=np.float32)
+        self._sqnorm = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self._tree = None
+        if len(names):
+            try:
+                # Imported here, not at module level, so `import analysis` stays cheap
+                from scipy.spatial import cKDTree
+            except ImportError:  # listed in requirements.txt; without it, fall back to a vectorized O(n) scan
+                pass
+            else:
+                self._tree = cKDTree(self.vectors)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_records(cls, records):
+        """From a {name: {"calories": .., "protein": .., ...}} mapping"""
+        names = np.array(list(records), dtype=str)
+        macros = np.array([[r[c] for c in MACRO_COLUMNS] for r in records.values()], dtype=np.float32)
+        serving_g = np.array([r.get("serving_g", 100) for r in records.values()], dtype=np.float32)
+        return cls(names, macros, serving_g)
+
+    @classmethod
+    def load(cls, path, cache_dir=None):
+        """Load a CSV/Parquet table, reusing memory-mapped columns while the source is unchanged"""
+        cache_dir = cache_dir or os.path.join(os.path.dirname(path) or ".", ".foodstore")
+        stamp = f"{os.path.getsize(path)}-{int(os.path.getmtime(path))}"
+        base = os.path.join(cache_dir, os.path.basename(path) + "." + stamp)
+        names_file, macros_file, serving_file = (base + suffix for suffix in (".names.npy", ".macros.npy", ".serving.npy"))
+        if not os.path.exists(serving_file):
+            cls._build_columns(path, names_file, macros_file, serving_file)
+        return cls(
+            np.load(names_file, mmap_mode="r"),
+            np.load(macros_file, mmap_mode="r"),
+            np.load(serving_file, mmap_mode="r"),
+        )
+
+    @staticmethod
+    def _build_columns(path, names_file, macros_file, serving_file):
+        import pandas as pd
+
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        df.columns = [c.strip().lower() for c in df.columns]
+        if "serving_g" not in df:
+            df["serving_g"] = 100
+        df = df.dropna(subset=["name", *MACRO_COLUMNS])
+        os.makedirs(os.path.dirname(names_file), exist_ok=True)
+        # Write under temporary names and rename, so concurrent loaders never see partial files
+        for target, values in (
+            (names_file, df["name"].astype(str).to_numpy(dtype=str)),
+            (macros_file, df[list(MACRO_COLUMNS)].to_numpy(dtype=np.float32)),
+            (serving_file, df["serving_g"].fillna(100).to_numpy(dtype=np.float32)),
+        ):
+            tmp = f"{target}.{os.getpid()}.tmp.npy"
+            np.save(tmp, values)
+            os.replace(tmp, target)
+
+    def nearest(self, macros, k=8, exclude=None):
+        """Row indices of the k foods closest to the given macros, closest first"""
+        if not len(self):
+            return np.array([], dtype=int)
+        query = np.array([macros[c] for c in MACRO_COLUMNS], dtype=np.float32) / self.scale
+        want = min(len(self), k + (1 if exclude else 0))
+        if self._tree is not None:
+            _, idx = self._tree.query(query, k=want)
+            idx = np.atleast_1d(idx)
+        else:
+            # |v - q|^2 without materializing v - q; |q|^2 is constant across rows
+            dist = self._sqnorm - 2 * (self.vectors @ query)
+            idx = np.argpartition(dist, want - 1)[:want] if want < len(self) else np.arange(len(self))
+            idx = idx[np.argsort(dist[idx])]
+        if exclude:
+            idx = idx[np.char.lower(self.names[idx]) != exclude.lower()]
+        return idx[:k]
+
+    def healthier_alternatives(self, macros, k=3, exclude=None, protein_weight=1.0):
+        """Row indices of foods with fewer calories and fats than ``macros``, best first.
+
+        Candidates are scored over the whole table at once: closeness of the
+        normalized macro profile, plus a bonus for keeping the protein.
+        """
+        calories, protein, fats = self.macros[:, 0], self.macros[:, 1], self.macros[:, 3]
+        candidates = np.flatnonzero((calories < macros["calories"]) & (fats < macros["fats"]))
+        if exclude and len(candidates):
+            candidates = candidates[np.char.lower(self.names[candidates]) != exclude.lower()]
+        if not len(candidates):
+            return candidates
+        query = np.array([macros[c] for c in MACRO_COLUMNS], dtype=np.float32) / self.scale
+        sq = self._sqnorm[candidates] - 2 * (self.vectors[candidates] @ query) + query @ query
+        distance = np.sqrt(np.maximum(sq, 0))
+        retention = np.minimum(protein[candidates] / max(macros["protein"], 1), 1)
+        score = protein_weight * retention - distance
+        if k < len(candidates):
+            top = np.argpartition(-score, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        return candidates[top[np.argsort(-score[top])]]
+
+    def frame(self, idx=None):
+        """Rows as a DataFrame in the chart layout (Food, Calories, Protein, Carbs, Fats)"""
+        import pandas as pd
+
+        idx = np.arange(len(self)) if idx is None else idx
+        macros = np.asarray(self.macros[idx])
+        return pd.DataFrame({
+            "Food": np.asarray(self.names[idx]),
+            "Calories": macros[:, 0], "Protein": macros[:, 1],
+            "Carbs": macros[:, 2], "Fats": macros[:, 3],
+        })
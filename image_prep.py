@@ -0,0 +1,130 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+# ------------------- IMAGE PREPROCESSING ------------------- #
+# Uploads are decoded straight from the upload buffer, rotated per EXIF,
+# downsampled and re-encoded to a size-bounded payload. Nothing touches disk.
+
+_QUALITY_STEPS = (85, 75, 65, 55, 45)
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class PreparedImage:
+    """Encoded model payload for one upload, decoded back to PIL on demand"""
+    __slots__ = ("payload", "mime_type", "digest", "cache_key", "_image")
+
+    def __init__(self, payload, mime_type, cache_key=None):
+        self.payload = payload
+        self.mime_type = mime_type
+        self.digest = hashlib.sha256(payload).hexdigest()
+        self.cache_key = cache_key  # PayloadCache key, from the raw upload's hash and the encode settings
+        self._image = None
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.payload))
+            self._image.load()
+        return self._image
+
+    @property
+    def blob(self):
+        """Inline image part in the shape the Gemini SDK accepts"""
+        return {"mime_type": self.mime_type, "data": self.payload}
+
+
+def _encode(image, fmt, quality):
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(out, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _to_rgb(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def encode_image(data, max_edge=1024, max_bytes=300 * 1024, fmt="JPEG"):
+    """Decode raw upload bytes and return a size-bounded encoded payload"""
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (max_edge, max_edge))  # cheap JPEG DCT downscale on decode
+    image = _to_rgb(ImageOps.exif_transpose(image))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    while True:
+        for quality in _QUALITY_STEPS:
+            payload = _encode(image, fmt, quality)
+            if len(payload) <= max_bytes:
+                return payload
+        if max(image.size) <= 256:
+            return payload
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+
+
+def encode_thumbnail(image, max_edge=384, quality=70):
+    """Small JPEG for display; a few tens of KB however large the upload was"""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return _encode(_to_rgb(thumbnail), "JPEG", quality)
+
+
+class PayloadCache:
+    """LRU of encoded payloads keyed by the hash of the raw upload, bounded by total bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def prepare_image(data, cache=None, max_edge=1024, max_bytes=300 * 1024, fmt="JPEG"):
+    """Preprocess raw upload bytes into a PreparedImage, reusing cached encodes"""
+    fmt = fmt.upper()
+    key = f"{hashlib.sha256(data).hexdigest()}:{max_edge}:{max_bytes}:{fmt}"
+    payload = cache.get(key) if cache is not None else None
+    if payload is None:
+        payload = encode_image(data, max_edge=max_edge, max_bytes=max_bytes, fmt=fmt)
+        if cache is not None:
+            cache.put(key, payload)
+    return PreparedImage(payload, _MIME_TYPES[fmt], cache_key=key)
+
+
+def cached_image(cache, key):
+    """The PreparedImage for a PayloadCache key, without the raw upload, or None if it was evicted"""
+    payload = cache.get(key)
+    if payload is None:
+        return None
+    return PreparedImage(payload, _MIME_TYPES[key.rsplit(":", 1)[1]], cache_key=key)
@@ -0,0 +1,284 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# ------------------- INSTRUMENTATION ------------------- #
+# Per-stage timings, cache hits, payload sizes and token counts, kept in process
+# memory for the debug panel and exportable as Prometheus text or as
+# OpenTelemetry-style JSON Lines spans.
+#
+# Switched on by APP_INSTRUMENTATION=1, or by setting APP_METRICS_PATH /
+# APP_TRACE_PATH. Decorators are applied at import time: when disabled they
+# return the function unchanged and every record_* call returns immediately,
+# so the cost is one boolean check.
+METRICS_PATH = os.environ.get("APP_METRICS_PATH")
+TRACE_PATH = os.environ.get("APP_TRACE_PATH")
+ENABLED = os.environ.get("APP_INSTRUMENTATION", "") not in ("", "0") or bool(METRICS_PATH or TRACE_PATH)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RECENT_SPANS = 200
+
+_lock = threading.Lock()
+_stages = {}  # stage -> [count, total seconds, max seconds, errors, bucket counts]
+_counters = {}  # (metric, sorted label items) -> value
+_gauges = {}  # (metric, sorted label items) -> last value set
+_spans = deque(maxlen=RECENT_SPANS)
+_current = contextvars.ContextVar("current_span", default=None)
+_local = threading.local()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed stage; nested spans on the same thread share a trace id"""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "start", "_wall", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self._token = _current.set(self)
+        self._wall = time.time_ns()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self._token)
+        _record_stage(self.name, elapsed, exc_type is not None)
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self._wall,
+            "endTimeUnixNano": self._wall + int(elapsed * 1e9),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": repr(exc)} if exc_type is not None else {"code": "OK"},
+        }
+        with _lock:
+            _spans.append(span)
+            if TRACE_PATH:
+                with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+        return False
+
+
+def span(name, **attributes):
+    """Context manager timing a block as stage ``name``"""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def stage(name):
+    """Decorator timing every call of the function as stage ``name``"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def cached_stage(name, cache):
+    """``cache(fn)`` (e.g. ``st.cache_data``) with every call timed as ``name``, the calls
+    that had to compute timed as ``name.compute`` and hits and misses counted"""
+    def decorate(fn):
+        if not ENABLED:
+            return cache(fn)
+
+        @wraps(fn)
+        def compute(*args, **kwargs):
+            _local.missed = True
+            with Span(name + ".compute", {}):
+                return fn(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            _local.missed = False
+            with Span(name, {}):
+                result = cached(*args, **kwargs)
+            record_cache(name, hit=not _local.missed)
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorate
+
+
+# ------------------- RECORDING ------------------- #
+def _record_stage(name, seconds, failed):
+    with _lock:
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = [0, 0.0, 0.0, 0, [0] * len(DURATION_BUCKETS)]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        stats[3] += failed
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                stats[4][i] += 1
+                break
+
+
+def _increment(metric, value=1, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record_cache(cache, hit):
+    if not ENABLED:
+        return
+    _increment("app_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def set_gauge(metric, value, **labels):
+    """Current level of something (e.g. bytes held), replacing the previous value"""
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[(metric, tuple(sorted(labels.items())))] = value
+
+
+def record_task(pool, result):
+    """Background task submissions: submitted, speculative, attached (already in flight), dropped, failed"""
+    if not ENABLED:
+        return
+    _increment("app_background_tasks_total", pool=pool, result=result)
+
+
+def record_bytes(stage_name, size):
+    """Payload size flowing through a stage (upload, encoded image, prompt, response)"""
+    if not ENABLED:
+        return
+    _increment("app_payload_bytes_total", size, stage=stage_name)
+    current = _current.get()
+    if current is not None:
+        current.attributes[f"bytes.{stage_name}"] = size
+
+
+def record_tokens(model, prompt_tokens, output_tokens, estimated=False):
+    if not ENABLED:
+        return
+    source = "estimated" if estimated else "reported"
+    _increment("app_model_tokens_total", prompt_tokens or 0, model=model, kind="prompt", source=source)
+    _increment("app_model_tokens_total", output_tokens or 0, model=model, kind="output", source=source)
+    current = _current.get()
+    if current is not None:
+        current.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+
+
+# ------------------- EXPORT ------------------- #
+def stage_summary():
+    """Per-stage rows for the debug panel, slowest total first"""
+    with _lock:
+        rows = [
+            {"stage": name, "calls": count, "total_ms": total * 1000, "mean_ms": total / count * 1000,
+             "max_ms": worst * 1000, "errors": errors}
+            for name, (count, total, worst, errors, _) in _stages.items()
+        ]
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def counters():
+    """Counters and gauges for the debug panel"""
+    with _lock:
+        return [{"metric": metric, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": value}
+                for (metric, labels), value in sorted({**_counters, **_gauges}.items())]
+
+
+def recent_spans():
+    with _lock:
+        return list(_spans)
+
+
+def _labels(items):
+    return ",".join(f'{k}="{str(v)}"' for k, v in items)
+
+
+def prometheus_text():
+    """Everything recorded so far in the Prometheus text exposition format"""
+    lines = [
+        "# HELP app_stage_duration_seconds Wall time per pipeline stage",
+        "# TYPE app_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for name, (count, total, _, _, buckets) in sorted(_stages.items()):
+            cumulative = 0
+            for bound, n in zip(DURATION_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'app_stage_duration_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'app_stage_duration_seconds_count{{stage="{name}"}} {count}')
+        lines.append("# TYPE app_stage_errors_total counter")
+        for name, (_, _, _, errors, _) in sorted(_stages.items()):
+            lines.append(f'app_stage_errors_total{{stage="{name}"}} {errors}')
+        metrics = sorted({metric for metric, _ in _counters})
+        for metric in metrics:
+            lines.append(f"# TYPE {metric} counter")
+            for (name, labels), value in sorted(_counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{{{_labels(labels)}}} {value}")
+        for metric in sorted({metric for metric, _ in _gauges}):
+            lines.append(f"# TYPE {metric} gauge")
+            for (name, labels), value in sorted(_gauges.items()):
+                if name == metric:
+                    lines.append(f"{metric}{{{_labels(labels)}}} {value}" if labels else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=None):
+    """Atomically rewrite the metrics file (APP_METRICS_PATH by default), e.g. for node_exporter's textfile collector"""
+    path = path or METRICS_PATH
+    if not ENABLED or not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _gauges.clear()
+        _spans.clear()
@@ -0,0 +1,216 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+# ------------------- MEAL LOG ------------------- #
+# Every analyzed meal, per user, in a SQLite file (WAL mode, shared by all worker
+# processes). Per-day totals are kept in their own table and updated in the same
+# transaction as each insert, update or delete, so intake over any window is a
+# primary-key range scan of at most one row per day, however long the history.
+
+MACRO_COLUMNS = ("calories", "protein", "carbs", "fats")
+MEAL_COLUMNS = ("id", "user_id", "eaten_at", "day", "food_name", *MACRO_COLUMNS, "grams", "image_hash", "source")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    eaten_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    food_name TEXT NOT NULL,
+    calories REAL NOT NULL,
+    protein REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fats REAL NOT NULL,
+    grams REAL,
+    image_hash TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS meals_user_time ON meals (user_id, eaten_at);
+CREATE INDEX IF NOT EXISTS meals_time ON meals (eaten_at);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    meals INTEGER NOT NULL,
+    calories REAL NOT NULL,
+    protein REAL NOT NULL,
+    carbs REAL NOT NULL,
+    fats REAL NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_DAY = """
+INSERT INTO daily_totals (user_id, day, meals, calories, protein, carbs, fats) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, day) DO UPDATE SET
+    meals = meals + excluded.meals,
+    calories = calories + excluded.calories,
+    protein = protein + excluded.protein,
+    carbs = carbs + excluded.carbs,
+    fats = fats + excluded.fats
+"""
+
+
+def day_of(timestamp):
+    """Local calendar day of a Unix timestamp, as YYYY-MM-DD"""
+    return datetime.date.fromtimestamp(timestamp).isoformat()
+
+
+class MealLog:
+    """Append-mostly meal history with per-day totals maintained on write"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn, *args):
+        # BEGIN IMMEDIATE takes the write lock up front, so a meal and its day
+        # totals always change together even with several processes writing
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _add_to_day(conn, user_id, day, meals, macros, sign=1):
+        conn.execute(_UPSERT_DAY, (user_id, day, sign * meals, *(sign * float(macros[c]) for c in MACRO_COLUMNS)))
+
+    # ------------------- WRITES ------------------- #
+    def add(self, user_id, food_name, macros, grams=None, image_hash=None, source=None, eaten_at=None):
+        """Log one meal; returns its id"""
+        eaten_at = time.time() if eaten_at is None else eaten_at
+        day = day_of(eaten_at)
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT INTO meals (user_id, eaten_at, day, food_name, calories, protein, carbs, fats, grams, image_hash, source)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, eaten_at, day, food_name, *(float(macros[c]) for c in MACRO_COLUMNS), grams, image_hash, source),
+            )
+            self._add_to_day(conn, user_id, day, 1, macros)
+            return cursor.lastrowid
+        return self._write(insert)
+
+    def update(self, meal_id, food_name=None, macros=None, grams=None):
+        """Correct a logged meal (e.g. its portion); day totals move by the difference"""
+        def change(conn):
+            row = conn.execute("SELECT * FROM meals WHERE id = ?", (meal_id,)).fetchone()
+            if row is None:
+                raise KeyError(meal_id)
+            new = {c: float(macros[c]) if macros else row[c] for c in MACRO_COLUMNS}
+            delta = {c: new[c] - row[c] for c in MACRO_COLUMNS}
+            conn.execute(
+                "UPDATE meals SET food_name = ?, calories = ?, protein = ?, carbs = ?, fats = ?, grams = ? WHERE id = ?",
+                (food_name or row["food_name"], *new.values(), grams if grams is not None else row["grams"], meal_id),
+            )
+            if any(delta.values()):
+                self._add_to_day(conn, row["user_id"], row["day"], 0, delta)
+        self._write(change)
+
+    def delete(self, meal_id):
+        def remove(conn):
+            row = conn.execute("SELECT * FROM meals WHERE id = ?", (meal_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM meals WHERE id = ?", (meal_id,))
+            self._add_to_day(conn, row["user_id"], row["day"], 1, row, sign=-1)
+            conn.execute("DELETE FROM daily_totals WHERE user_id = ? AND day = ? AND meals <= 0", (row["user_id"], row["day"]))
+            return True
+        return self._write(remove)
+
+    def rebuild_totals(self):
+        """Recompute every day's totals from the meals table (repair or migration)"""
+        def rebuild(conn):
+            conn.execute("DELETE FROM daily_totals")
+            conn.execute(
+                "INSERT INTO daily_totals (user_id, day, meals, calories, protein, carbs, fats)"
+                " SELECT user_id, day, COUNT(*), SUM(calories), SUM(protein), SUM(carbs), SUM(fats)"
+                " FROM meals GROUP BY user_id, day"
+            )
+        self._write(rebuild)
+
+    # ------------------- READS ------------------- #
+    def meals(self, user_id, start=None, end=None, limit=None):
+        """Logged meals between two Unix timestamps, newest first"""
+        query = "SELECT * FROM meals WHERE user_id = ? AND eaten_at >= ? AND eaten_at < ? ORDER BY eaten_at DESC"
+        params = [user_id, start if start is not None else float("-inf"), end if end is not None else float("inf")]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._conn().execute(query, params)]
+
+    def iter_chunks(self, user_id=None, start=None, end=None, chunk_size=10000):
+        """Meals (as tuples in MEAL_COLUMNS order) between two Unix timestamps, oldest first,
+        for one user or all users, fetched ``chunk_size`` rows at a time"""
+        query = f"SELECT {', '.join(MEAL_COLUMNS)} FROM meals WHERE eaten_at >= ? AND eaten_at < ?"
+        params = [start if start is not None else float("-inf"), end if end is not None else float("inf")]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        # A dedicated connection, so a long export does not hold this thread's shared one
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(query + " ORDER BY eaten_at", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            conn.close()
+
+    def daily_series(self, user_id, first_day, last_day):
+        """One row per calendar day in [first_day, last_day] (dates or ISO strings); days without meals are zero"""
+        first_day, last_day = (d if isinstance(d, datetime.date) else datetime.date.fromisoformat(d)
+                               for d in (first_day, last_day))
+        rows = {
+            row["day"]: dict(row) for row in self._conn().execute(
+                "SELECT * FROM daily_totals WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user_id, first_day.isoformat(), last_day.isoformat()),
+            )
+        }
+        series = []
+        for offset in range((last_day - first_day).days + 1):
+            day = (first_day + datetime.timedelta(days=offset)).isoformat()
+            row = rows.get(day) or {"day": day, "meals": 0, **dict.fromkeys(MACRO_COLUMNS, 0.0)}
+            row.pop("user_id", None)
+            series.append(row)
+        return series
+
+    def window_totals(self, user_id, days=1, end_day=None):
+        """Totals over the ``days`` calendar days ending on ``end_day`` (default today), plus
+        per-day averages over the days that have meals logged"""
+        end_day = end_day or datetime.date.today()
+        first_day = end_day - datetime.timedelta(days=days - 1)
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS active_days, COALESCE(SUM(meals), 0) AS meals,"
+            " COALESCE(SUM(calories), 0) AS calories, COALESCE(SUM(protein), 0) AS protein,"
+            " COALESCE(SUM(carbs), 0) AS carbs, COALESCE(SUM(fats), 0) AS fats"
+            " FROM daily_totals WHERE user_id = ? AND day BETWEEN ? AND ?",
+            (user_id, first_day.isoformat(), end_day.isoformat()),
+        ).fetchone()
+        totals = dict(row)
+        active = totals["active_days"]
+        totals["daily_average"] = {c: totals[c] / active if active else 0.0 for c in MACRO_COLUMNS}
+        return totals
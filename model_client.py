@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+
+# google-api-core's errors are matched by their HTTP ``code`` rather than imported:
+# importing them loads grpc, which would dominate the app's cold start
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# ------------------- MODEL CLIENT ------------------- #
+
+
+class CircuitOpenError(RuntimeError):
+    """The model backend is failing; calls are rejected until the breaker resets"""
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code in TRANSIENT_STATUS_CODES
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after ``reset_timeout``
+    seconds a single trial call is let through (half-open) to probe recovery"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError("model backend unavailable, failing fast")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ResilientBackend:
+    """Wraps a model backend (Gemini or a local fake) with a shared rate limiter,
+    jittered exponential retries for transient errors and a circuit breaker.
+    Per-call timeouts are enforced by the backend itself."""
+
+    def __init__(self, backend, limiter=None, breaker=None, retries=3,
+                 backoff_base=0.5, backoff_max=8.0, sleep=time.sleep):
+        self.backend = backend
+        self.name = backend.name
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+
+    def _backoff(self, attempt):
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, fn, *args):
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                if not is_transient(e):
+                    # The backend answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                self._sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def generate(self, prompt, generation_config=None):
+        return self._call(self.backend.generate, prompt, generation_config)
+
+    def vision(self, prompt, image, generation_config=None):
+        return self._call(self.backend.vision, prompt, image, generation_config)
+
+    def stream(self, prompt, generation_config=None):
+        # Retries cover opening the stream and its first chunk; a stream that
+        # fails midway is not replayed, since part of it was already shown
+        def open_stream():
+            chunks = iter(self.backend.stream(prompt, generation_config))
+            return chunks, next(chunks, None)
+
+        chunks, first = self._call(open_stream)
+        if first is None:
+            return
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            raise
@@ -0,0 +1,45 @@
+import re
+
+import numpy as np
+
+# ------------------- FUZZY NAME INDEX ------------------- #
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+
+def trigrams(name):
+    padded = f"  {normalize_name(name)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from character trigrams to names, scored with the Dice coefficient"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        postings = {}
+        self._sizes = np.empty(len(self.names), dtype=np.int32)
+        for i, name in enumerate(self.names):
+            grams = trigrams(name)
+            self._sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query, k=1):
+        """Best ``k`` matches as ``[(row, score)]`` with score in [0, 1], best first"""
+        grams = trigrams(query)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        hits = np.flatnonzero(shared)
+        scores = 2 * shared[hits] / (self._sizes[hits] + len(grams))
+        order = np.argsort(-scores)[:k]
+        return [(int(hits[i]), float(scores[i])) for i in order]
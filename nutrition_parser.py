@@ -0,0 +1,156 @@
+import json
+import math
+import re
+from dataclasses import asdict, dataclass, fields
+
+# ------------------- NUTRITION RECORDS ------------------- #
+MACRO_FIELDS = ("calories", "protein", "carbs", "fats")
+
+# Response schema for schema-constrained (JSON mode) generation
+NUTRITION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "food_name": {"type": "string"},
+        "calories": {"type": "number"},
+        "protein": {"type": "number"},
+        "carbs": {"type": "number"},
+        "fats": {"type": "number"},
+        "vitamins": {"type": "string"},
+        "serving_g": {"type": "number"},
+    },
+    "required": ["food_name", "calories", "protein", "carbs", "fats", "vitamins", "serving_g"],
+}
+
+
+class ParseError(ValueError):
+    """Model output did not contain a usable nutrition record"""
+
+
+@dataclass(slots=True, frozen=True)
+class NutritionRecord:
+    food_name: str
+    calories: int
+    protein: int
+    carbs: int
+    fats: int
+    vitamins: str
+    serving_g: float
+
+    @property
+    def macros(self):
+        return {"calories": self.calories, "protein": self.protein, "carbs": self.carbs, "fats": self.fats}
+
+
+def _number(value, field):
+    if isinstance(value, bool):  # float(True) would pass as 1
+        raise ParseError(f"{field}: not a number: {value!r}")
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if not match:
+            raise ParseError(f"{field}: not a number: {value!r}")
+        value = match.group(0)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ParseError(f"{field}: not a number: {value!r}") from None
+    if math.isnan(value) or math.isinf(value) or value < 0:
+        raise ParseError(f"{field}: out of range: {value!r}")
+    return value
+
+
+def _text(value, field, default):
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ParseError(f"{field}: not a string: {value!r}")
+    return value.strip() or default
+
+
+def _record(food_name, calories, protein, carbs, fats, vitamins, serving_g, reference_grams):
+    # All-zero macros are valid (water, black coffee, diet soda)
+    macros = [int(round(_number(v, f))) for v, f in zip((calories, protein, carbs, fats), MACRO_FIELDS)]
+    serving = _number(serving_g, "serving_g") if serving_g is not None else 0
+    return NutritionRecord(
+        food_name=_text(food_name, "food_name", "Your Food"),
+        calories=macros[0], protein=macros[1], carbs=macros[2], fats=macros[3],
+        vitamins=_text(vitamins, "vitamins", "None"),
+        serving_g=serving if serving > 0 else float(reference_grams),
+    )
+
+
+# ------------------- PARSERS ------------------- #
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+# Every "**Label**: value" line in one pass over the markdown response
+_MARKDOWN_FIELD = re.compile(
+    r"\*\*(Calories|Protein|Carbs|Fats|Notable Vitamins/Minerals|Serving Size|Food Name)\*\*:\s*([^\n]*)"
+)
+_MARKDOWN_KEYS = {
+    "Calories": "calories", "Protein": "protein", "Carbs": "carbs", "Fats": "fats",
+    "Notable Vitamins/Minerals": "vitamins", "Serving Size": "serving_g", "Food Name": "food_name",
+}
+_VITAMINS_VALUE = re.compile(r"[a-zA-Z, ]+")
+
+
+def parse_json(text, reference_grams=100):
+    """Parse a schema-constrained JSON response"""
+    match = _JSON_OBJECT.search(text)  # tolerate code fences around the object
+    if not match:
+        raise ParseError("no JSON object in response")
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise ParseError(f"invalid JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise ParseError("JSON response is not an object")
+    missing = [f for f in MACRO_FIELDS if f not in data]
+    if missing:
+        raise ParseError(f"missing fields: {', '.join(missing)}")
+    vitamins = data.get("vitamins")
+    if isinstance(vitamins, list):
+        vitamins = ", ".join(map(str, vitamins))
+    return _record(data.get("food_name"), data["calories"], data["protein"], data["carbs"], data["fats"],
+                   vitamins, data.get("serving_g"), reference_grams)
+
+
+def parse_markdown(text, reference_grams=100):
+    """Fallback for free-form "**Calories**: 350 kcal" style responses"""
+    found = {}
+    for label, value in _MARKDOWN_FIELD.findall(text):
+        found.setdefault(_MARKDOWN_KEYS[label], value.strip())
+    missing = [f for f in MACRO_FIELDS if f not in found]
+    if missing:
+        raise ParseError(f"missing fields: {', '.join(missing)}")
+    vitamins = _VITAMINS_VALUE.match(found.get("vitamins", ""))
+    return _record(found.get("food_name"), *(found[f] for f in MACRO_FIELDS),
+                   vitamins.group(0) if vitamins else None, found.get("serving_g"), reference_grams)
+
+
+def parse_nutrition(text, reference_grams=100):
+    """JSON first, then the markdown fallback; raises ParseError if neither yields a record"""
+    if not text:
+        raise ParseError("empty response")
+    stripped = text.lstrip()
+    if not (stripped.startswith("{") or stripped.startswith("```")):
+        return parse_markdown(text, reference_grams)
+    try:
+        return parse_json(text, reference_grams)
+    except ParseError as json_error:
+        try:
+            return parse_markdown(text, reference_grams)
+        except ParseError:
+            raise json_error from None
+
+
+def parse_many(texts, reference_grams=100):
+    """Parse many responses into a DataFrame, one row per text, with an error column"""
+    import pandas as pd
+
+    rows = []
+    for text in texts:
+        try:
+            rows.append({**asdict(parse_nutrition(text, reference_grams)), "error": None})
+        except ParseError as e:
+            rows.append({"error": str(e)})
+    columns = [f.name for f in fields(NutritionRecord)] + ["error"]
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import threading
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+# ------------------- PERCEPTUAL HASHES ------------------- #
+HASH_BITS = 64
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] *= np.sqrt(1 / n)
+    m[1:] *= np.sqrt(2 / n)
+    return m
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image):
+    """64-bit DCT hash: low-frequency coefficients of a 32x32 thumbnail against their median"""
+    small = np.asarray(image.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ small @ _DCT32.T)[:8, :8]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _to_signed(h):
+    # SQLite INTEGER is signed 64-bit
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def _to_unsigned(h):
+    return h + (1 << 64) if h < 0 else h
+
+
+# ------------------- NEAR-DUPLICATE INDEX ------------------- #
+class PerceptualIndex:
+    """Multi-index hashing over 64-bit perceptual hashes, persisted to SQLite.
+
+    The hash is split into ``m`` chunks. If two hashes are within ``max_distance``
+    bits, at least one chunk differs by at most ``max_distance // m`` bits, so a
+    lookup only probes the few buckets around each of the query's chunks instead
+    of scanning every stored hash.
+    """
+
+    def __init__(self, path=None, max_distance=6):
+        self.path = path
+        self.max_distance = max_distance
+        self.chunks = max_distance // 2 + 1
+        self.chunk_radius = max_distance // self.chunks
+        bounds = np.linspace(0, HASH_BITS, self.chunks + 1).astype(int)
+        self._spans = [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._probes = [self._flip_masks(hi - lo) for lo, hi in self._spans]
+        self._tables = [{} for _ in self._spans]
+        self._hashes = []
+        self._values = []
+        self._last_row = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS phashes (id INTEGER PRIMARY KEY, hash INTEGER NOT NULL, value TEXT NOT NULL)"
+            )
+            self._sync()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _flip_masks(self, width):
+        masks = [0]
+        for r in range(1, self.chunk_radius + 1):
+            for positions in combinations(range(width), r):
+                mask = 0
+                for p in positions:
+                    mask |= 1 << p
+                masks.append(mask)
+        return masks
+
+    def _chunk(self, h, span):
+        lo, hi = span
+        return (h >> (HASH_BITS - hi)) & ((1 << (hi - lo)) - 1)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, h, value):
+        idx = len(self._hashes)
+        self._hashes.append(h)
+        self._values.append(value)
+        for table, span in zip(self._tables, self._spans):
+            table.setdefault(self._chunk(h, span), []).append(idx)
+
+    def _sync(self):
+        """Pick up hashes added by other worker processes since the last sync"""
+        if not self.path:
+            return
+        rows = self._conn().execute(
+            "SELECT id, hash, value FROM phashes WHERE id > ? ORDER BY id", (self._last_row,)
+        ).fetchall()
+        with self._lock:
+            for row_id, h, value in rows:
+                if row_id > self._last_row:
+                    self._insert(_to_unsigned(h), json.loads(value))
+                    self._last_row = row_id
+
+    def add(self, h, value):
+        if self.path:
+            self._conn().execute(
+                "INSERT INTO phashes (hash, value) VALUES (?, ?)", (_to_signed(h), json.dumps(value))
+            )
+            self._sync()
+        else:
+            with self._lock:
+                self._insert(h, value)
+
+    def nearest(self, h, where=None):
+        """Closest stored value within ``max_distance`` as ``(distance, value)``, or None"""
+        self._sync()
+        best = None
+        seen = set()
+        for table, span, masks in zip(self._tables, self._spans, self._probes):
+            chunk = self._chunk(h, span)
+            for mask in masks:
+                for idx in table.get(chunk ^ mask, ()):
+                    if idx in seen:
+                        continue
+                    seen.add(idx)
+                    d = hamming(h, self._hashes[idx])
+                    if d > self.max_distance or (best is not None and d >= best[0]):
+                        continue
+                    if where is not None and not where(self._values[idx]):
+                        continue
+                    best = (d, self._values[idx])
+        return best
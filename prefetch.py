@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+
+# ------------------- PREFETCH ------------------- #
+
+
+class TaskPool:
+    """Process-wide thread pool whose tasks are keyed: while a task is in flight,
+    submitting the same key returns it instead of starting another. The pool is not
+    tied to any Streamlit script run, so work started before a rerun keeps going and
+    the rerun re-attaches to it. Speculative submissions are dropped rather than
+    queued once ``max_pending`` tasks are in flight."""
+
+    def __init__(self, workers, max_pending, name="tasks"):
+        self.name = name
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> (future, context)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def submit(self, key, fn, *args, context=None, speculative=False):
+        """Runs ``fn(*args)`` unless ``key`` is in flight. Returns (future, context) of the
+        task for ``key`` (``context`` is whatever the first submitter attached, e.g. a
+        stream buffer), or None when a speculative submission was dropped."""
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                result = "attached"
+            elif speculative and len(self._pending) >= self.max_pending:
+                entry, result = None, "dropped"
+            else:
+                entry = self._pending[key] = (self._executor.submit(fn, *args), context)
+                result = "speculative" if speculative else "submitted"
+        instrumentation.record_task(self.name, result)
+        if result in ("submitted", "speculative"):
+            entry[0].add_done_callback(lambda future: self._finish(key, future))
+        return entry
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._pending.get(key, (None,))[0] is future:
+                del self._pending[key]
+        if future.exception() is not None:
+            instrumentation.record_task(self.name, "failed")
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# ------------------- RESPONSE CACHE ------------------- #
+# Content-addressed store for model responses. Entries live in a single SQLite
+# file (WAL mode) so every Streamlit worker process on the host shares them and
+# they survive restarts. Eviction is LRU on last access, bounded by total size.
+# The total is kept by triggers in a one-row table, so no write has to sum the
+# whole cache. Reads only take the write lock once per batch of hits: access
+# times are buffered in memory and written together, and expired entries are
+# purged at most once a minute.
+
+ACCESS_FLUSH_SECONDS = 30  # buffered access times are written at least this often...
+ACCESS_FLUSH_BATCH = 256  # ...or once this many hits have accumulated
+PURGE_INTERVAL_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM responses;
+CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses
+BEGIN UPDATE cache_size SET total = total + NEW.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses
+BEGIN UPDATE cache_size SET total = total - OLD.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses
+BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size WHERE id = 0; END;
+"""
+
+
+def make_key(model_name, prompt, image_digest=None):
+    """Cache key for a (model, prompt, image) triple"""
+    h = hashlib.sha256()
+    for part in (model_name or "", prompt, image_digest or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded LRU cache with TTL, persisted to SQLite"""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._accessed = {}  # key -> last hit not yet written
+        self._accessed_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._purged_at = float("-inf")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def size(self):
+        """Total bytes of all entries, as kept by the triggers"""
+        return self._conn().execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if self.ttl and now - row[1] > self.ttl:
+            return None  # deleted by the next purge
+        with self._accessed_lock:
+            self._accessed[key] = now
+            due = (len(self._accessed) >= ACCESS_FLUSH_BATCH
+                   or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_SECONDS)
+        if due:
+            self.flush()
+        return row[0]
+
+    def flush(self):
+        """Write buffered access times in one transaction"""
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+            self._flushed_at = time.monotonic()
+        if not accessed:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # max(): another process may have recorded a later hit meanwhile
+            conn.executemany("UPDATE responses SET accessed = max(accessed, ?) WHERE key = ?",
+                             [(ts, key) for key, ts in accessed.items()])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def set(self, key, value):
+        # This process's recent hits count towards LRU order before anything is evicted
+        self.flush()
+        conn = self._conn()
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete does not fire triggers
+        conn.execute(
+            "INSERT INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+            " created = excluded.created, accessed = excluded.accessed",
+            (key, value, size, now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl and time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self._purged_at = time.monotonic()
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        excess = self.size - self.max_bytes
+        if excess <= 0:
+            return
+        # Walk from the least recently used end until we are back under budget
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._accessed_lock:
+            self._accessed.clear()
+        self._conn().execute("DELETE FROM responses")
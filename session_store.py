@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+# ------------------- SESSION STORE ------------------- #
+# What each browser session keeps between reruns: a small encoded thumbnail and
+# the content hashes of each upload, never the decoded image or the analysis
+# itself (results live in the shared response cache and pHash index, keyed by
+# those hashes). Entries are bounded per session and across the process, and
+# the least recently used ones are evicted first, so abandoned sessions age out
+# instead of holding memory until they expire.
+
+
+class SessionEntry:
+    """One upload: payload digest, PayloadCache key, perceptual hash and display thumbnail"""
+    __slots__ = ("digest", "payload_key", "image_hash", "thumbnail", "size")
+
+    def __init__(self, digest, payload_key, image_hash, thumbnail):
+        self.digest = digest
+        self.payload_key = payload_key
+        self.image_hash = image_hash
+        self.thumbnail = thumbnail
+        self.size = len(thumbnail) + len(digest) + len(payload_key) + 8
+
+
+class SessionStore:
+    """Per-session upload entries with a per-session and a global byte budget (LRU eviction)"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, session_max_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (session id, key) -> entry, least recently used first
+        self._sessions = {}  # session id -> OrderedDict(key -> entry), least recently used first
+        self._session_sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id, key):
+        with self._lock:
+            entry = self._entries.get((session_id, key))
+            if entry is not None:
+                self._entries.move_to_end((session_id, key))
+                self._sessions[session_id].move_to_end(key)
+            return entry
+
+    def put(self, session_id, key, digest, payload_key, image_hash, thumbnail):
+        """Store an upload's entry; returns it"""
+        entry = SessionEntry(digest, payload_key, image_hash, thumbnail)
+        with self._lock:
+            self._remove(session_id, key)
+            self._entries[(session_id, key)] = entry
+            self._sessions.setdefault(session_id, OrderedDict())[key] = entry
+            self._session_sizes[session_id] = self._session_sizes.get(session_id, 0) + entry.size
+            self.size += entry.size
+            # The session's own oldest entries go first, then everyone's; the new entry is always kept
+            session = self._sessions[session_id]
+            while self._session_sizes[session_id] > self.session_max_bytes and len(session) > 1:
+                self._remove(session_id, next(iter(session)))
+                self.evictions += 1
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                self._remove(*next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _remove(self, session_id, key):
+        entry = self._entries.pop((session_id, key), None)
+        if entry is None:
+            return
+        del self._sessions[session_id][key]
+        self.size -= entry.size
+        self._session_sizes[session_id] -= entry.size
+        if not self._sessions[session_id]:
+            del self._sessions[session_id], self._session_sizes[session_id]
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for key in list(self._sessions.get(session_id, ())):
+                self._remove(session_id, key)
+
+    def usage(self, session_id=None):
+        """Current footprint: process-wide, plus the given session's share"""
+        with self._lock:
+            usage = {"sessions": len(self._sessions), "entries": len(self._entries), "bytes": self.size,
+                     "max_bytes": self.max_bytes, "session_max_bytes": self.session_max_bytes,
+                     "evictions": self.evictions}
+            if session_id is not None:
+                usage["session_entries"] = len(self._sessions.get(session_id, ()))
+                usage["session_bytes"] = self._session_sizes.get(session_id, 0)
+            return usage
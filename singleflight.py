@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future
+
+# ------------------- SINGLE-FLIGHT ------------------- #
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key: the first caller runs,
+    everyone else arriving while it is in flight waits for its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def begin(self, key):
+        """Returns (future, leader). Only the leader must call finish() for the key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
@@ -1,323 +1,156 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
-import google.generativeai as genai
-from PIL import Image
-import tempfile
-import matplotlib.pyplot as plt
-import datetime
-import numpy as np
-import seaborn as sns
-import re
-from functools import lru_cache
 import time
+import datetime
 import concurrent.futures
+import os
+import tempfile
+from urllib.parse import urlencode
+import analysis
+import charts
+import export
+import instrumentation
+from analysis import (
+    BATCH_CONCURRENCY, DAILY_CALORIES, DAILY_MACROS, NO_ALTERNATIVES_TEXT, REFERENCE_GRAMS,
+    analyze_images, batch_results_frame, followup_inputs, generate_report, get_meal_log, get_model_client,
+    get_session_store, lookup_known_dish, portion_factor, prefetch_followups, scale_macros,
+    session_upload, start_followups
+)
+from instrumentation import cached_stage, stage
 
 # MUST BE THE FIRST STREAMLIT COMMAND
 st.set_page_config(page_title="Smart Food Analyzer", layout="wide", page_icon="🍏")
 
 # ------------------- CONFIG ------------------- #
-genai.configure(api_key="AIzaSyA0MVpJdhxriWKiOo4pIkeU7fr6iVWADwkof ")
-gemini_model = genai.GenerativeModel("gemini-2.5-pro-exp-03-25")
-DAILY_CALORIES = 2000
-DAILY_MACROS = {"protein": 50, "carbs": 275, "fats": 70}
-
-# Common food database (Western and Indian)
-FOOD_DATABASE = {
-    "Chicken Biryani": {"calories": 350, "protein": 15, "carbs": 45, "fats": 12},
-    "Paneer Tikka": {"calories": 280, "protein": 18, "carbs": 10, "fats": 20},
-    "Dal Tadka": {"calories": 200, "protein": 10, "carbs": 30, "fats": 5},
-    "Masala Dosa": {"calories": 320, "protein": 6, "carbs": 50, "fats": 10},
-    "Cheeseburger": {"calories": 550, "protein": 25, "carbs": 40, "fats": 30},
-    "Caesar Salad": {"calories": 350, "protein": 12, "carbs": 20, "fats": 25},
-    "Margherita Pizza": {"calories": 850, "protein": 35, "carbs": 100, "fats": 30},
-    "Grilled Salmon": {"calories": 400, "protein": 35, "carbs": 0, "fats": 28},
-    "Vegetable Stir Fry": {"calories": 250, "protein": 8, "carbs": 30, "fats": 12}
-}
-
-if "current_food_data" not in st.session_state:
-    st.session_state.current_food_data = None
+# Model, cache and analysis settings live in analysis.py; these only affect the page
+BATCH_MAX_CONCURRENCY = 16
+STREAM_REFRESH_SECONDS = 0.1
+# Per chart function; PNGs are 25-110 KB, so the four chart caches hold at most about 14 MB
+CHART_CACHE_ENTRIES = 32
+CHART_CACHE_TTL = 3600  # seconds
+CHART_TABS = ["Macronutrient Bar Chart", "Macronutrient Trend", "Calorie Comparison", "Macro Distribution"]
+# Streaming meal-log export the download button links to instead of building the file here,
+# e.g. http://localhost:8502/export while `cli.py serve` runs
+EXPORT_URL = os.environ.get("EXPORT_URL")
+
+if "prefetched_dish" not in st.session_state:
+    st.session_state.prefetched_dish = None
+if "logged_meals" not in st.session_state:
+    st.session_state.logged_meals = {}  # (user_id, image_hash) -> (meal id, logged values)
 
 # ------------------- CACHED FUNCTIONS ------------------- #
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def get_gemini_response(_model, prompt, _image=None):
-    """Cached function for Gemini API calls"""
-    if image:
-        return _model.generate_content([prompt, image])
-    return _model.generate_content(prompt)
-
-@st.cache_data
-def process_macros(response_text):
-    """Cached macro processing"""
-    macros = {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
-    patterns = {
-        "calories": r"\*\*Calories\*\*:\s*(\d+)\s*kcal",
-        "protein": r"\*\*Protein\*\*:\s*(\d+)\s*g",
-        "carbs": r"\*\*Carbs\*\*:\s*(\d+)\s*g",
-        "fats": r"\*\*Fats\*\*:\s*(\d+)\s*g"
-    }
-    for key, pattern in patterns.items():
-        match = re.search(pattern, response_text)
-        if match:
-            macros[key] = int(match.group(1))
-    
-    vitamins_match = re.search(r"\*\*Notable Vitamins/Minerals\*\*:\s*([a-zA-Z, ]+)", response_text)
-    vitamins = vitamins_match.group(1) if vitamins_match else "None"
-    
-    name_match = re.search(r"\*\*Food Name\*\*:\s*([^\n]+)", response_text)
-    food_name = name_match.group(1).strip() if name_match else "Your Food"
-    
-    return macros, food_name, vitamins
-
-# ------------------- OPTIMIZED IMAGE HANDLING ------------------- #
-def process_uploaded_image(uploaded_file):
-    """Optimized image processing with tempfile"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp.write(uploaded_file.read())
-        temp_path = temp.name
-    return Image.open(temp_path), temp_path
-
-# ------------------- PARALLEL PROCESSING ------------------- #
-def analyze_food_parallel(model, image, portion):
-    """Run parallelizable operations concurrently"""
-    def get_nutrition():
-        nutrition_prompt = (
-            f"You are a nutritionist AI. The user uploaded a food image and ate about {portion}. "
-            "Estimate nutritional values **without giving any ranges**. Return only the following in bullet points: "
-            "**Calories** (kcal), **Protein** (g), **Carbs** (g), **Fats** (g), and **Notable Vitamins/Minerals**. "
-            "Also suggest a name for this food item in this format: **Food Name**: [your suggestion]"
-        )
-        return get_gemini_response(model, nutrition_prompt, image)
-    
-    def get_health_tips():
-        return "Health tips placeholder"  # Will be updated after nutrition analysis
-    
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        nutrition_future = executor.submit(get_nutrition)
-        health_future = executor.submit(get_health_tips)
-        
-        return nutrition_future.result(), health_future.result()
+model_backend = get_model_client()
+meal_log = get_meal_log()
+session_store = get_session_store()
+# A bare import (e.g. benchmarks/bench.py) has no script run, so no browser session either
+script_run_ctx = get_script_run_ctx()
+session_id = script_run_ctx.session_id if script_run_ctx is not None else "local"
 
 # ------------------- VISUALIZATION FUNCTIONS ------------------- #
+# Chart PNGs are cached by the user's macros and food name; matplotlib is only
+# imported when the first one is drawn.
+chart_cache = st.cache_data(max_entries=CHART_CACHE_ENTRIES, ttl=CHART_CACHE_TTL, show_spinner=False)
+render_macro_comparison = cached_stage("chart.macro_comparison", chart_cache)(charts.render_macro_comparison)
+render_line_comparison = cached_stage("chart.line_comparison", chart_cache)(charts.render_line_comparison)
+render_pie_chart = cached_stage("chart.pie_chart", chart_cache)(charts.render_pie_chart)
+render_calorie_comparison = cached_stage("chart.calorie_comparison", chart_cache)(charts.render_calorie_comparison)
+
+@stage("plot.macro_comparison")
 def plot_macro_comparison(user_macros, food_name="Your Food"):
-    foods = list(FOOD_DATABASE.keys())
-    proteins = [FOOD_DATABASE[food]["protein"] for food in foods]
-    carbs = [FOOD_DATABASE[food]["carbs"] for food in foods]
-    fats = [FOOD_DATABASE[food]["fats"] for food in foods]
-    
-    foods.insert(0, food_name)
-    proteins.insert(0, user_macros["protein"])
-    carbs.insert(0, user_macros["carbs"])
-    fats.insert(0, user_macros["fats"])
-    
-    df = pd.DataFrame({
-        "Food": foods,
-        "Protein": proteins,
-        "Carbs": carbs,
-        "Fats": fats
-    })
-    
-    df_melted = df.melt(id_vars="Food", var_name="Macro", value_name="Value")
-    
-    plt.style.use('default')
-    sns.set_style("whitegrid")
-    plt.figure(figsize=(12, 8))
-    ax = sns.barplot(data=df_melted, x="Value", y="Food", hue="Macro", 
-                    palette={"Protein": "#4ECDC4", "Carbs": "#45B7D1", "Fats": "#FFC154"})
-    
-    for i, bar in enumerate(ax.patches):
-        if i < 3:
-            bar.set_edgecolor("#FF0000")
-            bar.set_linewidth(2)
-            bar.set_alpha(0.9)
-    
-    plt.title(f"Macronutrient Comparison: {food_name} vs Common Foods", pad=20, fontsize=14, fontweight='bold')
-    plt.xlabel("Amount (g)", fontsize=12)
-    plt.ylabel("")
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', title="Macronutrients")
-    plt.tight_layout()
-    st.pyplot(plt)
-    plt.clf()
+    st.image(render_macro_comparison(user_macros, food_name), width="stretch")
 
+@stage("plot.line_comparison")
 def plot_line_comparison(user_macros, food_name="Your Food"):
-    foods = list(FOOD_DATABASE.keys())
-    proteins = [FOOD_DATABASE[food]["protein"] for food in foods]
-    carbs = [FOOD_DATABASE[food]["carbs"] for food in foods]
-    fats = [FOOD_DATABASE[food]["fats"] for food in foods]
-    
-    foods.insert(0, food_name)
-    proteins.insert(0, user_macros["protein"])
-    carbs.insert(0, user_macros["carbs"])
-    fats.insert(0, user_macros["fats"])
-    
-    df = pd.DataFrame({
-        "Food": foods,
-        "Protein": proteins,
-        "Carbs": carbs,
-        "Fats": fats
-    })
-    
-    plt.style.use('default')
-    sns.set_style("whitegrid")
-    plt.figure(figsize=(14, 7))
-    
-    plt.plot(df['Food'], df['Protein'], marker='o', markersize=8, label='Protein', 
-             color='#4ECDC4', linewidth=3, linestyle='-', alpha=0.8)
-    plt.plot(df['Food'], df['Carbs'], marker='s', markersize=8, label='Carbs', 
-             color='#45B7D1', linewidth=3, linestyle='--', alpha=0.8)
-    plt.plot(df['Food'], df['Fats'], marker='^', markersize=8, label='Fats', 
-             color='#FFC154', linewidth=3, linestyle='-.', alpha=0.8)
-    
-    plt.axvline(x=0, color='red', linestyle='--', alpha=0.5, linewidth=2)
-    
-    plt.title(f"Macronutrient Trend: {food_name} vs Common Foods", fontsize=14, fontweight='bold', pad=20)
-    plt.xlabel("Food Items", fontsize=12)
-    plt.ylabel("Amount (g)", fontsize=12)
-    plt.xticks(rotation=45, ha='right', fontsize=10)
-    plt.yticks(fontsize=10)
-    plt.legend(fontsize=12, frameon=True, shadow=True)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    st.pyplot(plt)
-    plt.clf()
+    st.image(render_line_comparison(user_macros, food_name), width="stretch")
 
+@stage("plot.pie_chart")
 def plot_pie_chart(data):
-    fig, ax = plt.subplots(figsize=(2,2))
-    plt.style.use('default')
-    sns.set_style("white")
-    
-    labels = ['Protein', 'Carbs', 'Fats']
-    values = [data.get("protein", 0), data.get("carbs", 0), data.get("fats", 0)]
-    values = [v if not np.isnan(v) else 0 for v in values]
-    
-    if sum(values) == 0:
+    png = render_pie_chart(data)
+    if png is None:
         st.warning("⚠️ No valid macronutrient data to plot pie chart.")
         return
-    
-    explode = [0.05 if v == max(values) else 0 for v in values]
-    colors = ['#FF6347', '#3CB371', '#FFD700']
-    
-    wedges, texts, autotexts = ax.pie(values, explode=explode, labels=labels, 
-                                     autopct='%1.1f%%', startangle=140, colors=colors,
-                                     textprops={'fontsize': 6}, pctdistance=0.85,
-                                     wedgeprops={'edgecolor': 'white', 'linewidth': 1})
-    
-    centre_circle = plt.Circle((0,0),0.70,fc='white')
-    fig.gca().add_artist(centre_circle)
-    
-    ax.axis('equal')  
-    plt.title('Macronutrient Distribution', fontsize=10, fontweight='bold', pad=20)
-    st.pyplot(fig)
-    plt.clf()
-
-def plot_calorie_comparison(user_calories, food_name="Your Food"):
-    foods = list(FOOD_DATABASE.keys())
-    calories = [FOOD_DATABASE[food]["calories"] for food in foods]
-    
-    foods.insert(0, food_name)
-    calories.insert(0, user_calories)
-    
-    colors = ["#FF6B6B"] + ["#45B7D1"]*len(FOOD_DATABASE)
-    
-    plt.style.use('default')
-    sns.set_style("whitegrid")
-    plt.figure(figsize=(12, 7))
-    bars = plt.barh(foods, calories, color=colors, edgecolor='white', linewidth=0.7, alpha=0.9)
-    
-    for bar in bars:
-        width = bar.get_width()
-        plt.text(width + 10, bar.get_y() + bar.get_height()/2, 
-                f"{int(width)} kcal", ha='left', va='center',
-                fontsize=10, fontweight='bold')
-    
-    plt.title(f"Calorie Comparison: {food_name} vs Common Foods", fontsize=14, fontweight='bold', pad=20)
-    plt.xlabel("Calories (kcal)", fontsize=12)
-    plt.ylabel("")
-    plt.tight_layout()
-    st.pyplot(plt)
-    plt.clf()
-
-# ------------------- AI FUNCTIONS ------------------- #
-def suggest_healthier_option_gemini(macros, model):
-    prompt = f"""
-You are a professional nutritionist. A user uploaded food with this nutritional profile:
-- Calories: {macros['calories']} kcal
-- Protein: {macros['protein']} g
-- Carbs: {macros['carbs']} g
-- Fats: {macros['fats']} g
-
-Suggest 3 **healthier Food alternatives**. The alternatives must:
-- Have **lower calories and fats**
-- Include macro values in this format: Calories (kcal), Protein (g), Carbs (g), Fats (g)
-- Include a brief explanation of why each alternative is healthier
-
-Respond in bullet points with food names, their macros, and explanations.
-"""
-    return get_gemini_response(model, prompt).text
-
-def get_food_details(model, food_name, macros, vitamins):
-    prompt = f"""
-You are a professional nutritionist analyzing {food_name}. Provide detailed information about this food including:
-
-1. **Cultural Origins**: Where does this dish originate from? What cultures traditionally eat it?
-2. **Typical Ingredients**: List the main ingredients typically found in this dish
-3. **Health Benefits**: Based on its nutritional profile (Calories: {macros['calories']} kcal, Protein: {macros['protein']}g, Carbs: {macros['carbs']}g, Fats: {macros['fats']}g, Vitamins/Minerals: {vitamins}), what are the key health benefits?
-4. **Potential Concerns**: Are there any potential health concerns with consuming this food regularly?
-5. **Diet Compatibility**: Is this food suitable for: Vegetarian, Vegan, Keto, Gluten-free, Dairy-free diets?
-
-Format your response with clear headings for each section.
-"""
-    return get_gemini_response(model, prompt).text
-
-def get_recipe_suggestions(model, food_name):
-    prompt = f"""
-You are a professional chef specializing in healthy cooking. Provide:
-
-1. **Traditional Recipe**: A classic recipe for {food_name} with ingredients and step-by-step instructions
-2. **Healthier Variation**: A modified, healthier version of {food_name} with reduced calories/fats
-3. **Dietary Adaptations**: How to adapt this recipe for: Vegetarian, Vegan, Keto, Gluten-free diets
-
-Format your response with clear headings and bullet points for ingredients and numbered steps for instructions.
-Include approximate preparation and cooking times.
-"""
-    return get_gemini_response(model, prompt).text
-
-def generate_report(name, macros, gemini_summary, model):
-    calorie_pct = macros['calories'] / DAILY_CALORIES * 100
-    protein_pct = macros['protein'] / DAILY_MACROS['protein'] * 100
-    carbs_pct = macros['carbs'] / DAILY_MACROS['carbs'] * 100
-    fats_pct = macros['fats'] / DAILY_MACROS['fats'] * 100
-
-    suggestions = []
-    if fats_pct > 70:
-        suggestions.append("🔁 Try reducing the oil or butter used during cooking.")
-    if carbs_pct > 80:
-        suggestions.append("🥗 Consider pairing with a low-carb side like salad or sautéed greens.")
-    if calorie_pct > 60:
-        suggestions.append("🔥 Opt for grilling or steaming instead of frying.")
-    if protein_pct < 40:
-        suggestions.append("💪 Add a boiled egg, lentils, or a protein shake to boost protein intake.")
-
-    suggestions_text = "\n".join(suggestions) if suggestions else "✅ This meal looks balanced for your goals!"
-
-    alt_text = "\n### 🍽 Healthier Alternative Suggestions:\n"
-    alt_text += suggest_healthier_option_gemini(macros, model)
-
-    return f"""
-# Nutrition Report — {name}
-Date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
-
-## Nutritional Breakdown
-- Calories: {macros['calories']} kcal ({calorie_pct:.1f}% of daily need)
-- Protein: {macros['protein']} g ({protein_pct:.1f}%)
-- Carbs: {macros['carbs']} g ({carbs_pct:.1f}%)
-- Fats: {macros['fats']} g ({fats_pct:.1f}%)
-
-## Healthier Suggestions
-{suggestions_text}
-
-{alt_text}
-
-"""
+    st.image(png, width="stretch")
+
+@stage("plot.calorie_comparison")
+def plot_calorie_comparison(user_macros, food_name="Your Food"):
+    st.image(render_calorie_comparison(user_macros, food_name), width="stretch")
+
+
+# ------------------- MEAL LOG ------------------- #
+def log_meal(user_id, image_hash, food_name, macros, grams, source):
+    """Log an analysis once per session; rerunning with another portion corrects the same entry"""
+    key = (user_id, image_hash)
+    values = (food_name, tuple(macros.values()), grams)
+    logged = st.session_state.logged_meals.get(key)
+    if logged is None:
+        meal_id = meal_log.add(user_id, food_name, macros, grams=grams, image_hash=image_hash, source=source)
+        st.session_state.logged_meals[key] = (meal_id, values)
+    elif logged[1] != values:
+        meal_log.update(logged[0], food_name, macros, grams)
+        st.session_state.logged_meals[key] = (logged[0], values)
+
+def render_intake_dashboard(user_id):
+    """Today's intake and rolling 7/30-day daily averages against the targets"""
+    today = datetime.date.today()
+    st.markdown("---")
+    st.markdown(f"<h2 style='color: #2E86AB;'>📅 Intake History ({user_id})</h2>", unsafe_allow_html=True)
+    windows = [("Today", meal_log.window_totals(user_id, 1, today))] + [
+        (f"{days}-day daily average", meal_log.window_totals(user_id, days, today)) for days in (7, 30)
+    ]
+    for col, (label, totals) in zip(st.columns(len(windows)), windows):
+        values = totals if label == "Today" else totals["daily_average"]
+        col.metric(f"🔥 {label}", f"{values['calories']:.0f} kcal",
+                   f"{values['calories'] - DAILY_CALORIES:+.0f} vs {DAILY_CALORIES} target", delta_color="inverse")
+        col.caption(" · ".join(f"{name.title()} {values[name]:.0f}/{target} g" for name, target in DAILY_MACROS.items()))
+    series = pd.DataFrame(meal_log.daily_series(user_id, today - datetime.timedelta(days=29), today)).set_index("day")
+    st.bar_chart(series["calories"], height=220)
+    formats = [fmt for fmt in export.FORMATS if fmt != "parquet" or export.parquet_available()]
+    fmt_col, download_col = st.columns([1, 3], vertical_alignment="bottom")
+    fmt = fmt_col.selectbox("Export format", formats, key="export_format")
+    if EXPORT_URL:
+        # The browser downloads straight from the streaming endpoint; nothing passes through this process
+        download_col.link_button("⬇️ Download meal history",
+                                 f"{EXPORT_URL}?{urlencode({'format': fmt, 'user': user_id})}")
+    else:
+        # A callable is only run when the button is clicked, so reruns never pay for the export
+        download_col.download_button("⬇️ Download meal history", lambda: export_history(user_id, fmt),
+                                     file_name=f"meals-{user_id}.{fmt}", mime=export.FORMATS[fmt])
+
+
+def export_history(user_id, fmt):
+    """The export spooled to a temporary file, chunk by chunk. Streamlit still keeps the
+    finished download in memory to serve it; set EXPORT_URL to avoid that."""
+    spool = tempfile.TemporaryFile(buffering=0)  # a raw file, which download_button accepts
+    export.export_meals(meal_log, fmt, spool, user_id=user_id)
+    spool.seek(0)
+    return spool
+
+def render_debug_panel(container):
+    """Process-wide stage timings, cache hits, payload sizes and tokens recorded so far"""
+    with container.expander("⏱ Performance", expanded=True):
+        stages = instrumentation.stage_summary()
+        if not stages:
+            st.caption("Nothing recorded yet.")
+            return
+        st.dataframe(pd.DataFrame(stages).round(1), hide_index=True, width="stretch")
+        counters = instrumentation.counters()
+        if counters:
+            st.dataframe(pd.DataFrame(counters), hide_index=True, width="stretch")
+        spans = instrumentation.recent_spans()[-20:][::-1]
+        st.caption("Most recent spans")
+        st.dataframe(pd.DataFrame([
+            {"span": sp["name"], "ms": round((sp["endTimeUnixNano"] - sp["startTimeUnixNano"]) / 1e6, 1),
+             "status": sp["status"]["code"]}
+            for sp in spans
+        ]), hide_index=True, width="stretch")
+        usage = session_store.usage(session_id)
+        st.caption(f"Session store: {usage['session_entries']} uploads, {usage['session_bytes'] / 1024:.0f} of "
+                   f"{usage['session_max_bytes'] / 1024:.0f} KB in this session; {usage['sessions']} sessions, "
+                   f"{usage['bytes'] / 1024 ** 2:.1f} of {usage['max_bytes'] / 1024 ** 2:.0f} MB in total, "
+                   f"{usage['evictions']} evicted")
+        st.download_button("Download metrics (Prometheus)", instrumentation.prometheus_text(),
+                           file_name="metrics.prom", mime="text/plain")
 
 # ------------------- STYLING ------------------- #
 st.markdown("""
@@ -408,7 +241,17 @@ st.markdown("""
 with st.sidebar:
     st.markdown("<p style='text-align: center; color: #2E86AB;font-size: 35px'><b>🍽 Food Analyzer</b></p>", unsafe_allow_html=True)
     st.markdown("---")
-    uploaded_file = st.file_uploader("📸 Upload a food image", type=["jpg", "jpeg", "png"])
+    user_id = st.text_input("User ID", value="guest", help="Meals are logged and totalled per user").strip() or "guest"
+    analysis_mode = st.radio("Analysis mode", ["Single image", "Batch"], index=0, horizontal=True)
+    uploaded_file = dish_name = None
+    batch_files = []
+    if analysis_mode == "Single image":
+        uploaded_file = st.file_uploader("📸 Upload a food image", type=["jpg", "jpeg", "png"])
+        dish_name = st.text_input("Dish name (optional)", placeholder="e.g. Masala Dosa",
+                                  help="Known dishes are answered instantly from the food database")
+    else:
+        batch_files = st.file_uploader("📸 Upload food images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+        batch_concurrency = st.slider("Parallel analyses", min_value=1, max_value=BATCH_MAX_CONCURRENCY, value=BATCH_CONCURRENCY)
     mode = st.radio("Choose input type", ["By Weight (g)", "By Servings"], index=0)
     weight = quantity = None
 
@@ -417,11 +260,24 @@ with st.sidebar:
     else:
         quantity = st.number_input("Enter number of servings:", min_value=1, max_value=100, value=1)
 
+    stream_sections = st.checkbox("Stream AI sections as they are written", value=True)
+    explain_alternatives = st.checkbox("AI explanations for healthier alternatives", value=False)
+    show_debug_panel = instrumentation.ENABLED and st.checkbox("Show performance debug panel", value=False)
+
+    debug_panel = st.container() if show_debug_panel else None
+
     st.markdown("---")
     st.markdown("### About")
     st.markdown("This AI-powered tool analyzes your food photos and provides detailed nutritional information.")
     st.markdown("---")
 
+# A typed dish the food database knows gets its follow-ups warming before the photo is uploaded
+if uploaded_file is None and dish_name and st.session_state.prefetched_dish != dish_name:
+    st.session_state.prefetched_dish = dish_name
+    known_dish = lookup_known_dish(dish_name)
+    if known_dish:
+        prefetch_followups(model_backend, known_dish, explain_alternatives)
+
 # Main content area
 col1, col2 = st.columns([3, 1])
 with col1:
@@ -429,37 +285,78 @@ with col1:
 with col2:
     st.image("https://cdn-icons-png.flaticon.com/512/1046/1046857.png", width=100)
 
-if uploaded_file:
+if batch_files:
+    start_time = time.time()
+    portion = f"{weight} grams" if weight else f"{quantity} serving(s)"
+    st.markdown(f"<h2 style='color: #2E86AB;'>🗂 Batch Analysis ({len(batch_files)} images, {portion} each)</h2>", unsafe_allow_html=True)
+    progress = st.progress(0.0)
+    # Same session store as single uploads: reruns skip re-reading, hashing and decoding every file
+    uploads = [session_upload(session_id, f.file_id, f.getvalue) for f in batch_files]
+    prepared_images = [prepared for prepared, _ in uploads]
+    results = analyze_images(model_backend, prepared_images, max_workers=batch_concurrency,
+                             on_done=lambda done, total: progress.progress(done / total),
+                             hashes=[upload.image_hash for _, upload in uploads])
+    progress.progress(1.0)
+    batch_df = batch_results_frame([f.name for f in batch_files], results, weight, quantity)
+    for prepared, result in zip(prepared_images, results):
+        if "error" not in result:
+            factor = portion_factor(result["serving_g"], weight, quantity)
+            log_meal(user_id, prepared.digest, result["food_name"], scale_macros(result["macros"], factor),
+                     factor * REFERENCE_GRAMS, result["source"])
+    st.success(f"✅ Analyzed {len(batch_files)} images in {time.time()-start_time:.1f}s")
+
+    totals = batch_df[["calories", "protein", "carbs", "fats"]].sum()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("🔥 Total Calories", f"{totals['calories']:.0f} kcal", f"{totals['calories'] / DAILY_CALORIES * 100:.0f}% of daily")
+    col2.metric("🥩 Protein", f"{totals['protein']:.0f} g")
+    col3.metric("🍞 Carbohydrates", f"{totals['carbs']:.0f} g")
+    col4.metric("🧈 Fats", f"{totals['fats']:.0f} g")
+
+    st.dataframe(batch_df, width="stretch", hide_index=True)
+    failed = batch_df["error"].notna().sum()
+    if failed:
+        st.warning(f"⚠️ {failed} image(s) could not be analyzed.")
+    st.download_button("📄 Download Batch Results (CSV)", batch_df.to_csv(index=False), file_name="nutrition_batch.csv")
+    render_intake_dashboard(user_id)
+
+elif uploaded_file:
     start_time = time.time()
     
     with st.spinner("🧠 Analyzing your food image..."):
-        # Optimized image processing
-        image, temp_path = process_uploaded_image(uploaded_file)
+        # The session keeps a thumbnail and hashes of the upload; reruns rebuild the payload from
+        # the shared cache instead of re-reading and decoding the original photo
+        prepared, upload = session_upload(session_id, uploaded_file.file_id, uploaded_file.getvalue)
         
         # Display image immediately
         col1, col2 = st.columns([1, 2])
         with col1:
-            st.image(image, caption="Uploaded Food Image", use_column_width=True)
+            st.image(upload.thumbnail, caption="Uploaded Food Image", width="stretch")
         
         with col2:
-            portion = f"{weight} grams" if weight else f"{quantity} serving(s)"
-            
-            # Parallel processing
-            nutrition_response, _ = analyze_food_parallel(gemini_model, image, portion)
+            # Analysis is cached at the reference portion; the sidebar portion is applied locally
+            result = analyze_images(model_backend, [prepared], dish_names=[dish_name], hashes=[upload.image_hash])[0]
+            if "error" in result:
+                if result.get("unavailable"):
+                    # Degrade gracefully: the local food database still works without the model
+                    st.warning("⚠️ The AI model is temporarily unavailable. Enter the dish name in the sidebar "
+                               "to get results from the food database, or try again in a moment.")
+                else:
+                    st.error(f"❌ Analysis failed: {result['error']}")
+                st.stop()
+            food_name, vitamins = result["food_name"], result["vitamins"]
+            factor = portion_factor(result["serving_g"], weight, quantity)
+            macros = scale_macros(result["macros"], factor)
+            log_meal(user_id, prepared.digest, food_name, macros, factor * REFERENCE_GRAMS, result["source"])
             
-            # Process response with cached function
-            macros, food_name, vitamins = process_macros(nutrition_response.text)
+            # Follow-up prompts run in the background while the page renders. They describe one
+            # serving, so changing the portion does not change (or re-issue) them, and a rerun
+            # attaches to the ones still in flight.
+            serving_macros, alternatives_text = followup_inputs(result)
+            followups = start_followups(model_backend, food_name, serving_macros, vitamins,
+                                        alternatives_text=alternatives_text if explain_alternatives else None,
+                                        stream=stream_sections)
             
-            st.success(f"✅ Analysis complete! (Took {time.time()-start_time:.1f}s)")
-            
-            # Store current food data
-            st.session_state.current_food_data = {
-                "name": food_name,
-                "macros": macros,
-                "nutrition_text": nutrition_response.text,
-                "image_path": temp_path,
-                "vitamins": vitamins
-            }
+            st.success(f"✅ Analysis complete! (Took {time.time()-start_time:.1f}s, from {result['source']})")
 
     if macros is None:
         st.warning("⚠️ No valid nutrition data detected. Please check the image quality or the food item.")
@@ -520,75 +417,102 @@ if uploaded_file:
             st.markdown(f"""
             <div class="food-card">
                 <h3>✨ Notable Vitamins/Minerals</h3>
-                <p>{st.session_state.current_food_data['vitamins']}</p>
+                <p>{vitamins}</p>
             </div>
             """, unsafe_allow_html=True)
 
+        render_intake_dashboard(user_id)
+
         # Visualizations
         st.markdown("---")
         st.markdown(f"<h2 style='color: #2E86AB;'>📈 Nutritional Comparisons</h2>", unsafe_allow_html=True)
         
-        tab1, tab2, tab3, tab4 = st.tabs(["Macronutrient Bar Chart", "Macronutrient Trend", "Calorie Comparison", "Macro Distribution"])
-        
-        with tab1:
-            if tab1:  # Lazy loading
-                plot_macro_comparison(macros, food_name)
-                
-        with tab2:
-            if tab2:
-                plot_line_comparison(macros, food_name)
-                
-        with tab3:
-            if tab3:
-                plot_calorie_comparison(macros['calories'], food_name)
+        # Only the selected chart is rendered (st.tabs would run all four on every rerun)
+        chart = st.radio("Chart", CHART_TABS, horizontal=True, label_visibility="collapsed")
         
-        with tab4:
-            if tab4:
-                plot_pie_chart(macros)
-
-        # Healthier Alternatives
+        if chart == "Macronutrient Bar Chart":
+            plot_macro_comparison(macros, food_name)
+        elif chart == "Macronutrient Trend":
+            plot_line_comparison(macros, food_name)
+        elif chart == "Calorie Comparison":
+            plot_calorie_comparison(macros, food_name)
+        else:
+            plot_pie_chart(macros)
+
+        # Section placeholders in page order, filled as each follow-up completes
         st.markdown("---")
         st.markdown(f"<h2 style='color: #2E86AB;'>🥗 Healthier Alternatives</h2>", unsafe_allow_html=True)
-        
-        with st.spinner("Finding healthier options..."):
-            gemini_alternatives_text = suggest_healthier_option_gemini(macros, gemini_model)
-            if "Calories" in gemini_alternatives_text:
-                st.markdown(f"""
-                <div class="food-card">
-                    {gemini_alternatives_text.replace('•', '🍎')}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.info("Couldn't find better alternatives for this food.")
-
-        # Food Details Section
-        st.markdown("---")
-        st.markdown(f"<h2 style='color: #2E86AB;'>🍲 Detailed Food Analysis: {food_name}</h2>", unsafe_allow_html=True)
-        
-        with st.spinner("Generating detailed food analysis..."):
-            food_details = get_food_details(gemini_model, food_name, macros, vitamins)
+        if alternatives_text:
             st.markdown(f"""
-            <div class="detail-card">
-                {food_details}
+            <div class="food-card">
+
+{alternatives_text}
+
             </div>
             """, unsafe_allow_html=True)
+        else:
+            st.info("Couldn't find better alternatives for this food.")
+        alternatives_slot = st.empty()
+        if "alternatives" in followups:
+            alternatives_slot.info("⏳ Explaining the alternatives...")
+
+        st.markdown("---")
+        st.markdown(f"<h2 style='color: #2E86AB;'>🍲 Detailed Food Analysis: {food_name}</h2>", unsafe_allow_html=True)
+        details_slot = st.empty()
+        details_slot.info("⏳ Generating detailed food analysis...")
 
-        # Recipe Suggestions Section
         st.markdown("---")
         st.markdown(f"<h2 style='color: #2E86AB;'>👨‍🍳 Recipe Suggestions for {food_name}</h2>", unsafe_allow_html=True)
-        
-        with st.spinner("Generating recipe ideas..."):
-            recipes = get_recipe_suggestions(gemini_model, food_name)
-            st.markdown(f"""
-            <div class="detail-card">
-                {recipes}
-            </div>
-            """, unsafe_allow_html=True)
+        recipes_slot = st.empty()
+        recipes_slot.info("⏳ Generating recipe ideas...")
 
-        # Download Report
         st.markdown("---")
-        report_text = generate_report(food_name, macros, nutrition_response.text, gemini_model)
-        st.download_button("📄 Download Full Nutrition Report", report_text, file_name=f"nutrition_report_{food_name}.txt")
+        report_slot = st.empty()
+
+        # The report is built on click from the sections finished by then; it never waits on the model
+        report_sections = {"alternatives": alternatives_text or NO_ALTERNATIVES_TEXT}
+        report_slot.download_button("📄 Download Full Nutrition Report",
+                                    lambda: generate_report(food_name, macros, dict(report_sections)),
+                                    file_name=f"nutrition_report_{food_name}.txt", mime="text/plain")
+
+        slots = {"alternatives": alternatives_slot, "details": details_slot, "recipes": recipes_slot}
+        shown = {}
+        pending = {future: section for section, (future, _) in followups.items()}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, timeout=STREAM_REFRESH_SECONDS, return_when=concurrent.futures.FIRST_COMPLETED)
+            # Partial text for sections still streaming
+            for future, section in pending.items():
+                if future in done:
+                    continue
+                partial = followups[section][1].text
+                if partial and partial != shown.get(section):
+                    shown[section] = partial
+                    card = "food-card" if section == "alternatives" else "detail-card"
+                    slots[section].markdown(f"""
+                    <div class="{card}">
+                        {partial} ▌
+                    </div>
+                    """, unsafe_allow_html=True)
+            for future in done:
+                section = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    slots[section].warning(f"⚠️ This section is temporarily unavailable ({type(e).__name__}).")
+                    continue
+                report_sections["alternatives_explanation" if section == "alternatives" else section] = text
+                if section == "alternatives":
+                    alternatives_slot.markdown(f"""
+                    <div class="food-card">
+                        {text}
+                    </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    slots[section].markdown(f"""
+                    <div class="detail-card">
+                        {text}
+                    </div>
+                    """, unsafe_allow_html=True)
 
 else:
     # Initial empty state
@@ -605,4 +529,13 @@ else:
             <li>Recipe suggestions and adaptations</li>
         </ul>
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+    if meal_log.window_totals(user_id, 30)["meals"]:
+        render_intake_dashboard(user_id)
+
+store_usage = session_store.usage()
+for name in ("sessions", "entries", "bytes", "evictions"):
+    instrumentation.set_gauge(f"app_session_store_{name}", store_usage[name])
+instrumentation.write_prometheus()
+if debug_panel is not None:
+    render_debug_panel(debug_panel)
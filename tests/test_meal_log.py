@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+from meal_log import MACRO_COLUMNS, MealLog
+
+END = datetime.date(2024, 3, 31)
+
+
+def at(day, hour=12):
+    return datetime.datetime.combine(day, datetime.time(hour)).timestamp()
+
+
+def macros(calories, protein=10, carbs=20, fats=5):
+    return {"calories": calories, "protein": protein, "carbs": carbs, "fats": fats}
+
+
+def totals(log):
+    rows = log._conn().execute("SELECT * FROM daily_totals ORDER BY user_id, day").fetchall()
+    return [(r["user_id"], r["day"], r["meals"], *(pytest.approx(r[c]) for c in MACRO_COLUMNS)) for r in rows]
+
+
+@pytest.fixture
+def log(tmp_path):
+    return MealLog(str(tmp_path / "meals.sqlite3"))
+
+
+def test_incremental_totals_match_a_rebuild(log):
+    ids = {}
+    for offset in range(40):
+        day = END - datetime.timedelta(days=offset)
+        for user in ("ana", "ben"):
+            for hour in (8, 13, 19)[: 1 + offset % 3]:
+                ids[user, offset, hour] = log.add(user, "Dal Tadka", macros(100 + offset + hour), grams=150,
+                                                  eaten_at=at(day, hour))
+    log.update(ids["ana", 0, 8], macros=macros(900.5, 40, 10, 30), grams=450)
+    log.update(ids["ben", 5, 8], food_name="Paneer Tikka")  # name only: totals unchanged
+    log.delete(ids["ana", 3, 8])  # the only meal that day
+    log.delete(ids["ben", 4, 13])  # one of two
+    assert not log.delete(ids["ben", 4, 13])
+    with pytest.raises(KeyError):
+        log.update(10 ** 6, macros=macros(1))
+
+    incremental = totals(log)
+    log.rebuild_totals()
+    assert incremental == totals(log)
+    assert ("ana", (END - datetime.timedelta(days=3)).isoformat()) not in {row[:2] for row in incremental}
+
+
+def test_window_totals_bounds_and_averages(log):
+    log.add("ana", "a", macros(700), eaten_at=at(END, 23))
+    log.add("ana", "b", macros(300), eaten_at=at(END, 0))
+    log.add("ana", "c", macros(500), eaten_at=at(END - datetime.timedelta(days=6)))  # first day of the 7-day window
+    log.add("ana", "d", macros(999), eaten_at=at(END - datetime.timedelta(days=7)))  # just outside it
+    log.add("ana", "e", macros(400), eaten_at=at(END - datetime.timedelta(days=29)))  # first day of the 30-day window
+    log.add("ana", "f", macros(888), eaten_at=at(END - datetime.timedelta(days=30)))
+    log.add("ana", "g", macros(111), eaten_at=at(END + datetime.timedelta(days=1)))
+    log.add("ben", "h", macros(5000), eaten_at=at(END))
+
+    today = log.window_totals("ana", 1, END)
+    assert (today["meals"], today["calories"], today["active_days"]) == (2, 1000, 1)
+    week = log.window_totals("ana", 7, END)
+    assert (week["meals"], week["calories"], week["active_days"]) == (3, 1500, 2)
+    assert week["daily_average"]["calories"] == 750  # over days with meals, not all seven
+    month = log.window_totals("ana", 30, END)
+    assert (month["meals"], month["calories"], month["active_days"]) == (5, 2899, 4)
+
+
+def test_window_totals_without_meals(log):
+    empty = log.window_totals("nobody", 30, END)
+    assert (empty["meals"], empty["calories"], empty["active_days"]) == (0, 0, 0)
+    assert empty["daily_average"] == dict.fromkeys(MACRO_COLUMNS, 0.0)
+
+
+def test_daily_series_fills_days_without_meals(log):
+    log.add("ana", "a", macros(200), eaten_at=at(END - datetime.timedelta(days=2)))
+    log.add("ana", "b", macros(300), eaten_at=at(END - datetime.timedelta(days=2), 18))
+    log.add("ana", "c", macros(999), eaten_at=at(END + datetime.timedelta(days=1)))
+    series = log.daily_series("ana", (END - datetime.timedelta(days=3)).isoformat(), END)
+    assert [row["day"] for row in series] == [(END - datetime.timedelta(days=d)).isoformat() for d in (3, 2, 1, 0)]
+    assert [row["calories"] for row in series] == [0.0, 500.0, 0.0, 0.0]
+    assert [row["meals"] for row in series] == [0, 2, 0, 0]
+    assert all("user_id" not in row for row in series)
+    assert log.daily_series("nobody", END, END) == [{"day": END.isoformat(), "meals": 0,
+                                                     **dict.fromkeys(MACRO_COLUMNS, 0.0)}]
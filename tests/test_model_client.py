@@ -0,0 +1,134 @@
+import time
+
+import pytest
+
+from backends import FakeBackend, FakeBackendError
+from model_client import CircuitBreaker, CircuitOpenError, ResilientBackend, TokenBucket, is_transient
+
+
+class FlakyBackend(FakeBackend):
+    """FakeBackend that fails its first ``failures`` calls with a transient 429"""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def generate(self, prompt, generation_config=None):
+        self.error_rate = 1.0 if self.calls < self.failures else 0.0
+        return super().generate(prompt, generation_config)
+
+
+def client(backend, **kwargs):
+    sleeps = []
+    return ResilientBackend(backend, sleep=sleeps.append, **kwargs), sleeps
+
+
+def test_transient_errors_are_retried_with_capped_backoff():
+    backend = FlakyBackend(failures=2)
+    resilient, sleeps = client(backend, retries=3, backoff_base=0.5, backoff_max=0.75)
+    assert "Canned response" in resilient.generate("hello")
+    assert backend.calls == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 0.75
+    assert resilient.breaker.state == "closed" and resilient.breaker.failures == 0
+
+
+def test_gives_up_after_the_last_retry():
+    backend = FakeBackend(error_rate=1.0)
+    resilient, sleeps = client(backend, retries=2, breaker=CircuitBreaker(failure_threshold=10))
+    with pytest.raises(FakeBackendError):
+        resilient.generate("hello")
+    assert backend.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_permanent_errors_are_not_retried_and_do_not_trip_the_breaker():
+    class BadRequest(FakeBackend):
+        def generate(self, prompt, generation_config=None):
+            self.calls += 1
+            raise ValueError("400 invalid argument")
+
+    backend = BadRequest()
+    resilient, sleeps = client(backend, breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(ValueError):
+        resilient.generate("hello")
+    assert backend.calls == 1 and not sleeps
+    assert resilient.breaker.state == "closed"
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_one_trial_call():
+    backend = FakeBackend(error_rate=1.0)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    resilient, _ = client(backend, retries=5, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        resilient.generate("hello")
+    assert backend.calls == 3
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        resilient.generate("hello")
+    assert backend.calls == 3
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_call()  # the trial call is in flight; everyone else still fails fast
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    backend.error_rate = 0.0
+    assert "Canned response" in resilient.generate("hello")
+    assert breaker.state == "closed"
+
+
+def test_stream_retries_opening_but_not_a_failure_midway():
+    class BrokenStream(FakeBackend):
+        def stream(self, prompt, generation_config=None):
+            self.calls += 1
+            if self.calls == 1:
+                raise FakeBackendError("429 before the first chunk")
+            yield "first"
+            raise FakeBackendError("429 midway")
+
+    backend = BrokenStream()
+    resilient, sleeps = client(backend, retries=3)
+    chunks = resilient.stream("hello")
+    assert next(chunks) == "first"
+    with pytest.raises(FakeBackendError):
+        next(chunks)
+    assert backend.calls == 2 and len(sleeps) == 1
+    assert resilient.breaker.failures == 1
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(2):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.04
+    for _ in range(2):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_limiter_is_used_for_every_attempt():
+    class CountingBucket:
+        acquired = 0
+
+        def acquire(self):
+            self.acquired += 1
+
+    limiter = CountingBucket()
+    resilient, _ = client(FlakyBackend(failures=1), limiter=limiter)
+    resilient.generate("hello")
+    assert limiter.acquired == 2
+
+
+def test_status_codes_decide_what_is_transient():
+    class ApiError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    assert is_transient(ApiError(429)) and is_transient(ApiError(503)) and is_transient(TimeoutError())
+    assert not is_transient(ApiError(400)) and not is_transient(ValueError())
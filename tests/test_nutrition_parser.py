@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from nutrition_parser import NutritionRecord, ParseError, parse_json, parse_many, parse_markdown, parse_nutrition
+
+RECORD = {"food_name": "Masala Dosa", "calories": 178, "protein": 3.4, "carbs": 28, "fats": 6,
+          "vitamins": "Potassium, Folate", "serving_g": 180}
+MARKDOWN = """Here is the estimate:
+- **Food Name**: Masala Dosa
+- **Calories**: 178 kcal (approx.)
+- **Protein**: 3.4 g
+- **Carbs**: 28 g
+- **Fats**: 6 g
+- **Notable Vitamins/Minerals**: Potassium, Folate (per 100 g)
+- **Serving Size**: 180 g
+- **Calories**: 999 kcal
+"""
+EXPECTED = NutritionRecord("Masala Dosa", 178, 3, 28, 6, "Potassium, Folate", 180.0)
+
+
+def test_json():
+    assert parse_nutrition(json.dumps(RECORD)) == EXPECTED
+
+
+def test_json_inside_code_fences():
+    assert parse_nutrition(f"```json\n{json.dumps(RECORD)}\n```") == EXPECTED
+
+
+def test_markdown_fallback_takes_the_first_value_of_each_field():
+    assert parse_nutrition(MARKDOWN) == EXPECTED
+    assert parse_markdown(MARKDOWN) == EXPECTED
+
+
+def test_fenced_markdown_falls_back_when_the_json_is_unusable():
+    assert parse_nutrition(f"```\n{MARKDOWN}```") == EXPECTED
+
+
+def test_zero_calorie_foods_are_valid():
+    water = {"food_name": "Water", "calories": 0, "protein": 0, "carbs": 0, "fats": 0, "vitamins": "", "serving_g": 250}
+    record = parse_nutrition(json.dumps(water))
+    assert record.macros == {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
+    assert record.vitamins == "None" and record.serving_g == 250
+
+
+def test_defaults_for_missing_optional_fields():
+    record = parse_json(json.dumps({"calories": 100, "protein": 1, "carbs": 2, "fats": 3}), reference_grams=100)
+    assert (record.food_name, record.vitamins, record.serving_g) == ("Your Food", "None", 100.0)
+
+
+def test_vitamin_lists_are_joined():
+    assert parse_nutrition(json.dumps({**RECORD, "vitamins": ["C", "Iron"]})).vitamins == "C, Iron"
+
+
+@pytest.mark.parametrize("value", [True, False, None, "NaN", "lots", -5, "Infinity"])
+def test_invalid_numbers_are_rejected(value):
+    text = json.dumps({**RECORD, "calories": value})
+    with pytest.raises(ParseError):
+        parse_json(text)
+
+
+def test_nan_literal_is_rejected():
+    with pytest.raises(ParseError):
+        parse_nutrition(json.dumps(RECORD).replace("178", "NaN"))
+
+
+@pytest.mark.parametrize("field, value", [("food_name", 1), ("food_name", ["Dosa"]), ("vitamins", {"C": 1}),
+                                          ("vitamins", 5)])
+def test_non_string_text_fields_are_rejected(field, value):
+    with pytest.raises(ParseError):
+        parse_nutrition(json.dumps({**RECORD, field: value}))
+
+
+@pytest.mark.parametrize("text", ["", "no nutrition here", "{\"calories\": 1}", "[1, 2]"])
+def test_unusable_responses(text):
+    with pytest.raises(ParseError):
+        parse_nutrition(text)
+
+
+def test_parse_many_reports_errors_per_row():
+    df = parse_many([json.dumps(RECORD), "nothing useful", MARKDOWN])
+    assert list(df.columns) == ["food_name", "calories", "protein", "carbs", "fats", "vitamins", "serving_g", "error"]
+    assert df["error"].isna().tolist() == [True, False, True]
+    assert "missing fields" in df.loc[1, "error"]
+    assert df.loc[2, "calories"] == 178
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+from PIL import Image, ImageFilter
+
+from phash_index import HASH_BITS, PerceptualIndex, hamming, phash
+
+
+def flip(h, bits, rng):
+    for position in rng.sample(range(HASH_BITS), bits):
+        h ^= 1 << position
+    return h
+
+
+def brute_force(stored, query, max_distance, where=None):
+    distances = [hamming(query, h) for h, value in stored if where is None or where(value)]
+    distances = [d for d in distances if d <= max_distance]
+    return min(distances) if distances else None
+
+
+@pytest.mark.parametrize("max_distance", [0, 1, 2, 3, 4, 6, 8, 10])
+def test_nearest_matches_a_brute_force_scan(max_distance):
+    rng = random.Random(max_distance)
+    index = PerceptualIndex(max_distance=max_distance)
+    bases = [rng.getrandbits(HASH_BITS) for _ in range(40)]
+    stored = []
+    for i, base in enumerate(bases):
+        # Clusters of near-duplicates around each base, at every distance up to past the limit
+        for bits in range(0, max_distance + 3, 2):
+            h = flip(base, bits, rng)
+            stored.append((h, {"id": len(stored), "even": i % 2 == 0}))
+            index.add(h, stored[-1][1])
+    queries = [flip(base, bits, rng) for base in bases for bits in range(max_distance + 3)]
+    queries += [rng.getrandbits(HASH_BITS) for _ in range(50)]
+    even = lambda value: value["even"]  # noqa: E731
+    for query in queries:
+        for where in (None, even):
+            expected = brute_force(stored, query, max_distance, where)
+            found = index.nearest(query, where=where)
+            assert (found[0] if found else None) == expected
+            if found:
+                h = next(h for h, value in stored if value is found[1])
+                assert hamming(query, h) == found[0] and (where is None or where(found[1]))
+
+
+def test_hashes_persist_and_sync_across_instances(tmp_path):
+    path = str(tmp_path / "phash.sqlite3")
+    first, second = PerceptualIndex(path, max_distance=4), PerceptualIndex(path, max_distance=4)
+    top_bit = 1 << 63  # stored as a negative SQLite integer
+    first.add(top_bit | 0b1011, {"food_name": "Dal Tadka"})
+    assert second.nearest(top_bit | 0b1000) == (2, {"food_name": "Dal Tadka"})
+    assert len(PerceptualIndex(path)) == 1
+
+
+def test_phash_is_stable_under_resizing_and_light_blur():
+    rng = random.Random(0)
+    blocks = Image.frombytes("L", (8, 6), bytes(rng.randrange(256) for _ in range(48)))
+    image = blocks.resize((400, 300), Image.Resampling.BICUBIC).convert("RGB")
+    h = phash(image)
+    assert hamming(h, phash(image.resize((200, 150)))) <= 6
+    assert hamming(h, phash(image.filter(ImageFilter.GaussianBlur(1)))) <= 6
+    assert hamming(h, phash(image.transpose(Image.Transpose.ROTATE_90))) > 6
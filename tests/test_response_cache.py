@@ -0,0 +1,108 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, make_key
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "responses.sqlite3")
+
+
+def stored(cache):
+    return {key for key, in cache._conn().execute("SELECT key FROM responses")}
+
+
+def summed(cache):
+    return cache._conn().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_keys_depend_on_model_prompt_and_image():
+    keys = {make_key("m", "p"), make_key("m2", "p"), make_key("m", "p2"), make_key("m", "p", "img"), make_key("mp", "")}
+    assert len(keys) == 5
+
+
+def test_least_recently_used_entries_are_evicted_by_size(path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(response_cache.time, "time", lambda: next(clock))
+    cache = ResponseCache(path, max_bytes=300, ttl=None)
+    for key in "abc":
+        cache.set(key, "x" * 100)
+    assert cache.get("a") == "x" * 100  # now more recently used than b
+    cache.set("d", "é" * 50)  # 100 bytes of UTF-8
+    assert stored(cache) == {"a", "c", "d"}
+    cache.set("e", "x" * 250)
+    assert stored(cache) == {"e"}
+    assert cache.size == summed(cache) == 250
+
+
+def test_total_size_is_tracked_through_replace_evict_and_clear(path):
+    cache = ResponseCache(path, max_bytes=1000, ttl=None)
+    cache.set("a", "x" * 100)
+    cache.set("a", "x" * 40)
+    cache.set("b", "x" * 700)
+    assert cache.size == summed(cache) == 740
+    cache.set("c", "x" * 500)
+    assert cache.size == summed(cache) <= 1000
+    cache.clear()
+    assert cache.size == 0 and cache.get("c") is None
+
+
+def test_entries_expire_after_the_ttl(path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(path, ttl=60)
+    cache.set("old", "value")
+    now[0] += 30
+    cache.set("new", "value")
+    assert cache.get("old") == "value"
+    now[0] += 31
+    assert cache.get("old") is None
+    assert cache.get("new") == "value"
+    cache._purged_at = float("-inf")  # the next write purges
+    cache.set("newer", "value")
+    assert stored(cache) == {"new", "newer"}
+    assert cache.size == summed(cache)
+
+
+def test_entries_persist_across_instances(path):
+    ResponseCache(path).set(make_key("m", "p"), "answer")
+    assert ResponseCache(path).get(make_key("m", "p")) == "answer"
+
+
+def test_hits_are_written_in_batches(path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(response_cache.time, "time", lambda: next(clock))
+    monkeypatch.setattr(response_cache, "ACCESS_FLUSH_BATCH", 3)
+    cache = ResponseCache(path)
+    for key in "abc":
+        cache.set(key, "value")
+
+    def accessed():
+        return dict(cache._conn().execute("SELECT key, accessed FROM responses"))
+
+    before = accessed()
+    cache.get("a")
+    cache.get("b")
+    assert accessed() == before  # buffered, no write yet
+    cache.get("c")
+    assert all(accessed()[key] > before[key] for key in "abc")
+    assert not cache._accessed
+
+
+def test_buffered_hits_count_before_eviction(path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(response_cache.time, "time", lambda: next(clock))
+    cache = ResponseCache(path, max_bytes=200, ttl=None)
+    cache.set("a", "x" * 100)
+    cache.set("b", "x" * 100)
+    cache.get("a")  # buffered, flushed by the next set
+    cache.set("c", "x" * 100)
+    assert stored(cache) == {"a", "c"}
+
+
+def test_existing_caches_get_their_total_on_open(path):
+    cache = ResponseCache(path)
+    cache.set("a", "x" * 10)
+    cache._conn().execute("DROP TABLE cache_size")
+    assert ResponseCache(path).size == 10